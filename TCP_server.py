@@ -1,32 +1,20 @@
-import json
-import math
 import socket
+import threading
 
 import numpy as np
-from scipy import integrate
-from scipy.spatial.transform import Rotation as R
 
-
-class GyroscopeOrientation:
-    def __init__(self):
-        self.dt = 0.02  # Time interval in seconds (10 ms - 0.02)
-        self.x_angle = 0  # Initial orientation angle around x-axis
-        self.y_angle = 0  # Initial orientation angle around y-axis
-        self.z_angle = 0  # Initial orientation angle around z-axis
-
-    def update_orientation(self, gyro_x, gyro_y, gyro_z):
-        # Integrate the gyroscope data to update the orientation angles
-        self.x_angle += gyro_x * self.dt
-        self.y_angle += gyro_y * self.dt
-        self.z_angle += gyro_z * self.dt
-
-        # Normalize the angles to keep them within the range of 0 to 2*pi
-        self.x_angle = self.x_angle % (2 * math.pi)
-        self.y_angle = self.y_angle % (2 * math.pi)
-        self.z_angle = self.z_angle % (2 * math.pi)
-
-    def get_gyro(self):
-        return self.x_angle, self.y_angle, self.z_angle
+from columnar_log import GRAPHICS_COLUMNS
+from flow_control import BoundedBuffer
+from frame_reassembler import FrameReassembler
+from gyro import GyroscopeOrientation
+from kinematics import BlockIntegrator
+from metrics import INTEGRATION_SECONDS, StatsReporter, install_profile_signal
+from orientation import quaternion_to_euler_scalar
+from pipeline import IngestPipeline
+from recorder import OUTPUT_DIR, get_recorder
+import sensor_decoder
+from sensor_decoder import Schema, SensorDecoder, apply_motion, times, untimed_value
+from shm_ring import SharedRingWriter
 
 
 class RotationVector:
@@ -44,18 +32,7 @@ class RotationVector:
         self.y = y
         self.z = z
         self.w = w
-        t0 = +2.0 * (w * x + y * z)
-        t1 = +1.0 - 2.0 * (x * x + y * y)
-        roll_x = math.degrees(math.atan2(t0, t1))
-        t2 = +2.0 * (w * y - z)
-        if t2 > 1.0:
-            t2 = 1.0
-        if t2 < -1.0:
-            t2 = -1.0
-        pitch_y = math.degrees(math.asin(t2))
-        t3 = +2.0 * (w * z + x * y)
-        t4 = +1.0 - 2.0 * (y * y + z * z)
-        yaw_z = math.degrees(math.atan2(t3, t4))
+        roll_x, pitch_y, yaw_z = quaternion_to_euler_scalar(x, y, z, w, degrees=True)
         self.roll_x = roll_x
         self.pitch_y = pitch_y
         self.yaw_z = yaw_z
@@ -66,47 +43,54 @@ class RotationVector:
 
 
 class LinearAcceleration:
-    def __init__(self):
+    def __init__(self, block_size=16):
         self.x = 0
         self.y = 0
         self.z = 0
-        self.velocity = 0
-        self.position = (0, 0, 0)
-        self.time_interval = 0
+        self.velocity = np.zeros(3)
+        self.position = np.zeros(3)
         self.prev_time_stamp = 0
+        # Samples are buffered and integrated a block at a time (timestamps are in ns)
+        self.block_size = block_size
+        self.integrator = BlockIntegrator(time_scale=1e-9)
+        self.times = np.empty(block_size)
+        self.samples = np.empty((block_size, 3))
+        self.count = 0
 
     def update(self, acc_x, acc_y, acc_z, time_stamp):
-        if self.prev_time_stamp == 0:
-            self.prev_time_stamp = time_stamp / 1e9
+        self.x = acc_x
+        self.y = acc_y
+        self.z = acc_z
+        self.prev_time_stamp = time_stamp / 1e9
+
+        self.times[self.count] = time_stamp
+        self.samples[self.count] = acc_x, acc_y, acc_z
+        self.count += 1
+        if self.count == self.block_size:
+            self.flush()
+
+    def update_block(self, time_stamps, acc):
+        # Integrate a whole block of samples, time_stamps (n,) in ns and acc (n, 3)
+        self.flush()
+        acc = np.asarray(acc, dtype=float).reshape(-1, 3)
+        if len(acc) == 0:
             return
-        else:
-            self.time_interval = abs(self.prev_time_stamp - time_stamp / 1e9)
-            self.prev_time_stamp = time_stamp / 1e9
-
-        # # Integrate each component of the acceleration to get the velocity.
-        # velocity_x = integrate.cumtrapz(acc_x, self.time_interval, initial=0)
-        # velocity_y = integrate.cumtrapz(acc_y, self.time_interval, initial=0)
-        # velocity_z = integrate.cumtrapz(acc_z, self.time_interval, initial=0)
-        #
-        # # Integrate each component of the velocity to get the position.
-        # position_x = integrate.cumtrapz(velocity_x, self.time_interval, initial=0)
-        # position_y = integrate.cumtrapz(velocity_y, self.time_interval, initial=0)
-        # position_z = integrate.cumtrapz(velocity_z, self.time_interval, initial=0)
-        #
-        # self.velocity = [velocity_x, velocity_y, velocity_z]
-        # self.position = [position_x, position_y, position_z]
-
-        self.x = (acc_x)
-        self.y = (acc_y)
-        self.z = (acc_z)
-
-        self.velocity += np.array([acc_x, acc_y, acc_z]) * self.time_interval
-        self.position += self.velocity * self.time_interval
-        self.position /= 5
-        # print(self.position)
-
-        # self.velocity = np.cumsum(acceleration_array * self.time_intervals, axis=0)
-        # self.position = np.cumsum(self.velocity * self.time_intervals, axis=0)
+        with INTEGRATION_SECONDS.time():
+            velocity, position = self.integrator.process(time_stamps, acc)
+        self.x, self.y, self.z = acc[-1]
+        self.prev_time_stamp = time_stamps[-1] / 1e9
+        self.velocity = velocity[-1]
+        self.position = position[-1]
+        return velocity, position
+
+    def flush(self):
+        if self.count == 0:
+            return
+        with INTEGRATION_SECONDS.time():
+            velocity, position = self.integrator.process(self.times[:self.count], self.samples[:self.count])
+        self.velocity = velocity[-1]
+        self.position = position[-1]
+        self.count = 0
 
     def get_data(self):
         return [self.x, self.y, self.z, self.prev_time_stamp]
@@ -117,43 +101,83 @@ class LinearAcceleration:
 
 class TrajectoryCalculator:
     def __init__(self, initial_position=(0, 0, 0), initial_velocity=(0, 0, 0), time_interval=0.01):
-        self.initial_position = initial_position
-        self.initial_velocity = initial_velocity
+        self.initial_position = np.asarray(initial_position, dtype=float)
+        self.initial_velocity = np.asarray(initial_velocity, dtype=float)
         self.time_interval = time_interval
-        # self.new_pos =
 
     def calculate_new_position(self, linear_acceleration):
-        new_x = self.initial_position[0] + self.initial_velocity[0] * self.time_interval + 0.5 * linear_acceleration[
-            0] * self.time_interval ** 2
-        new_y = self.initial_position[1] + self.initial_velocity[1] * self.time_interval + 0.5 * linear_acceleration[
-            1] * self.time_interval ** 2
-        new_z = self.initial_position[2] + self.initial_velocity[2] * self.time_interval + 0.5 * linear_acceleration[
-            2] * self.time_interval ** 2
-        return new_x, new_y, new_z
-
-    def get_pos(self):
-        return
+        # Works on a single (3,) acceleration or an (n, 3) array of accelerations
+        dt = self.time_interval
+        return self.initial_position + self.initial_velocity * dt + 0.5 * np.asarray(linear_acceleration) * dt ** 2
 
 
 class TrajectoryReconstructor:
     def __init__(self):
-        self.velocity = np.array([0, 0, 0])
-        self.position = np.array([0, 0, 0])
-        self.last_time = None
+        # Timestamps are in microseconds
+        self.integrator = BlockIntegrator(time_scale=1e-6)
 
-    def update(self, time, acceleration):
-        if self.last_time is None:
-            self.last_time = float(time) / 1e6
-            return
+    @property
+    def velocity(self):
+        return self.integrator.velocity
 
-        dt = float(time) - self.last_time / 1e6
-        self.velocity += acceleration * dt
-        self.position += self.velocity * dt
-        self.last_time = time
+    @property
+    def position(self):
+        return self.integrator.position
+
+    def update(self, time, acceleration):
+        self.integrator.process([float(time)], [acceleration])
+
+
+class MotionLog:
+    """
+    Recorder logs of one device (orientation, position, acceleration) and optionally the live ring of the
+    visualizers. suffix is added to the file names so several devices are recorded side by side.
+    """
+
+    def __init__(self, recorder, suffix='', live=None):
+        self.recorder = recorder
+        self.suffix = suffix
+        self.orientation_log = recorder.channel(f'orientation{suffix}.txt', 4)
+        self.position_log = recorder.channel(f'position{suffix}.txt', 3)
+        self.graphics_log = recorder.channel(f'graphics{suffix}.txt', 4, delimiter=',')
+        self.graphics_bin = recorder.columnar_channel(f'graphics{suffix}.bin', GRAPHICS_COLUMNS)
+        self.live = live
+
+    def close(self):
+        # Closes the files of this device, the live ring belongs to the caller
+        for name in (f'orientation{self.suffix}.txt', f'position{self.suffix}.txt', f'graphics{self.suffix}.txt',
+                     f'graphics{self.suffix}.bin'):
+            self.recorder.close_channel(name)
+
+    def persist(self, quaternion, position, acc_data):
+        if all(quaternion):
+            self.orientation_log.append(quaternion)
+        if all(position):
+            self.position_log.append(position)
+            self.graphics_log.append(acc_data)
+            self.graphics_bin.append(acc_data)
+        if self.live is not None:
+            self.live.write((acc_data[3], *quaternion, *position, *acc_data[:3]))
+
+
+# The phone app of this server also sends {'value': [x, y, z, w, accuracy]} rotation vector frames,
+# read as a quaternion here (TCP_server_SensorStreamer reads the same key as a 3 value rotation vector)
+FRAME_SCHEMAS = dict(sensor_decoder.FRAME_SCHEMAS, value=Schema('rotation_vector', 4, untimed_value))
+
+PIPELINE_WORKERS = 0  # Parse processes of the receive / parse / persist pipeline, 0 handles packets serially
+PIPELINE_REPORT_INTERVAL = 5  # Seconds between queue depth reports in pipeline mode
+PRINT_PACKETS = False  # Echo every received packet, slows down the receive loop considerably
+STATS_INTERVAL = 5  # Seconds between metrics lines
+# Frames buffered between a receive thread and the processing loop, 0 receives and processes in one loop
+INGEST_BUFFER = 4096
+# Overload policy of the buffer: 'block' (the receive thread waits, TCP pushes back on the phone, nothing is lost),
+# or the lossy 'drop_oldest' and 'decimate' (to INGEST_RATE_HZ) when keeping up matters more than every sample
+INGEST_POLICY = 'block'
+INGEST_RATE_HZ = 100
 
 
 class TCP_server:
-    def __init__(self):
+    def __init__(self, pipeline_workers=PIPELINE_WORKERS):
         # Set up the server
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.host = socket.gethostname()
@@ -164,13 +188,32 @@ class TCP_server:
         self.client_socket = None
         self.addr = None
         self.received_data = list()
-        self.gyro = GyroscopeOrientation()
+        self.gyro = GyroscopeOrientation(dt=0.02)
         self.rot_vec = RotationVector()
         self.linear_acc = LinearAcceleration()
         self.tr = TrajectoryReconstructor()
+        self.reassembler = FrameReassembler()
+        self.decoder = SensorDecoder(FRAME_SCHEMAS)
+        self.recorder = get_recorder()
+        # Live samples for the visualizers: timestamp, quaternion, position, acceleration (shm_ring.IMU_COLUMNS)
+        self.live = SharedRingWriter()
+        self.log = MotionLog(self.recorder, live=self.live)
+        self.pipeline = IngestPipeline(self.persist, workers=pipeline_workers, frame_schemas=FRAME_SCHEMAS) if pipeline_workers else None
+        self.stats = StatsReporter(STATS_INTERVAL).start()
+        # IMU_PROFILE=1 enables on demand profiles with kill -USR1
+        install_profile_signal(OUTPUT_DIR)
+
+        self.ingest = None
+        if INGEST_BUFFER and self.pipeline is None:
+            self.ingest = BoundedBuffer(INGEST_BUFFER, INGEST_POLICY, rate_hz=INGEST_RATE_HZ)
 
         self.__init_connection()
-        self.__transmit_data()
+        if self.pipeline is not None:
+            self.__run_pipeline()
+        elif self.ingest is not None:
+            self.__transmit_buffered()
+        else:
+            self.__transmit_data()
 
     def __init_connection(self):
         print(f"Server Listening on, {self.IPAddr} | {self.host}, port {self.port}")
@@ -181,70 +224,92 @@ class TCP_server:
     def __transmit_data(self):
         # Receive data from the client (your Android app)
         while True:
-            data = self.client_socket.recv(256)
-            if not data:
+            n = self.reassembler.recv_from(self.client_socket)
+            if not n:
                 break
 
-            print(data)
-            self.extract_sensor_data(data)
+            if PRINT_PACKETS:
+                print(self.reassembler.last_read(n))
+            self.extract_sensor_data()
             # x, y, z, w = self.rot_vec.get_orientation()
             # print(x, y, z, w)
             quaternion = self.rot_vec.get_orientation()
             position = self.linear_acc.get_position()
             # position = self.tr.position
+            self.persist(self.addr, quaternion, position, self.linear_acc.get_data())
 
-            if all(quaternion):
-                with open(r"C:\Users\Admin\Desktop\orientation.txt", 'a') as f:
-                    txt = ';'.join([str(item) for item in quaternion])
-                    txt += '\n'
-                    f.write(txt)
-            if all(position):
-                with open(r"C:\Users\Admin\Desktop\position.txt", 'a') as f:
-                    txt = ';'.join([str(item) for item in position])
-                    txt += '\n'
-                    f.write(txt)
-                with open(r"C:\Users\Admin\Desktop\graphics.txt", 'a') as f:
-                    txt = ','.join([str(item) for item in self.linear_acc.get_data()])
-                    txt += '\n'
-                    f.write(txt)
-
+        print("Connection closed, stats:", self.reassembler.get_stats())
         self.client_socket.close()
+        self.live.close()
+        self.recorder.flush()
+
+    def __receive_frames(self):
+        # Receive thread, only splits the stream into frames so the socket is always drained
+        while self.reassembler.recv_from(self.client_socket):
+            if self.reassembler.binary:
+                records = self.reassembler.records()
+                if len(records):
+                    self.ingest.put(records)
+                continue
+            for line in self.reassembler.frames():
+                self.ingest.put(line)
+        self.ingest.close()
+
+    def __transmit_buffered(self):
+        # Under overload the buffer sheds frames by its policy instead of letting latency grow
+        threading.Thread(target=self.__receive_frames, name='receive', daemon=True).start()
+        while True:
+            items = self.ingest.get_batch(256)
+            if items is None:
+                break
+            for item in items:
+                if isinstance(item, np.ndarray):
+                    # A block of binary records
+                    self.decoder.decode_records(item)
+                    continue
+                json_data = self.reassembler.decode(item)
+                if json_data is not None:
+                    self.decoder.decode_frame(json_data)
+            self.apply(self.decoder.take())
+            self.persist(self.addr, self.rot_vec.get_orientation(), self.linear_acc.get_position(),
+                         self.linear_acc.get_data())
+
+        print("Connection closed, stats:", self.reassembler.get_stats(), self.ingest.get_stats())
+        self.client_socket.close()
+        self.live.close()
+        self.recorder.flush()
+
+    def __run_pipeline(self):
+        # Receiving, parsing and persisting overlap, the main thread only reports the stage queues
+        self.pipeline.start()
+        self.pipeline.receive(self.client_socket, self.addr)
+        while self.pipeline.running():
+            for thread in self.pipeline.receivers:
+                thread.join(PIPELINE_REPORT_INTERVAL)
+            print("Pipeline:", self.pipeline.get_stats())
+        self.pipeline.close()
+
+        print("Connection closed, stats:", self.pipeline.get_stats())
+        self.client_socket.close()
+        self.live.close()
+        self.recorder.flush()
+
+    def persist(self, device, quaternion, position, acc_data):
+        self.log.persist(quaternion, position, acc_data)
+
+    def extract_sensor_data(self, data=None):
+        # data is optional, frames already read with recv_from are in the reassembler buffer
+        if data is not None:
+            self.reassembler.feed(data)
+        self.decoder.feed(self.reassembler)
+        self.apply(self.decoder.take())
+
+    def apply(self, batches):
+        apply_motion(batches, self.rot_vec, self.linear_acc)
+        gyro = batches.get('gyroscope')
+        if gyro is not None:
+            self.gyro.update_block(times(gyro), gyro[1])
 
-    def extract_gyro(self, data):
-        entries = data.decode('utf-8').split('\n')
-        for entry in entries:
-            try:
-                json_data = json.loads(entry)
-                if 'gyroscope' in json_data:
-                    gyroscope_value = json_data['gyroscope'].get('value')
-                    if gyroscope_value:
-                        self.gyro.update_orientation(*gyroscope_value)
-            except json.JSONDecodeError:
-                pass
-
-    def extract_sensor_data(self, data):
-        entries = data.decode('utf-8').split('\n')
-        # print(entries)
-        for entry in entries:
-            try:
-                json_data = json.loads(entry)
-                if 'rotationVectorData' in json_data:
-                    self.rot_vec.update(*json_data['rotationVectorData'][:-1])
-                if 'linearAccelerationData' in json_data:
-                    # self.tr.update(json_data['timestamp'], json_data['linearAccelerationData'])
-                    self.linear_acc.update(*json_data['linearAccelerationData'], json_data['timestamp'])
-            except json.JSONDecodeError:
-                pass
-
-    def extract_rotation_vector(self, data):
-        entries = data.decode('utf-8').split('\n')
-        for entry in entries:
-            try:
-                json_data = json.loads(entry)
-                if 'value' in json_data:
-                    self.rot_vec.update(*json_data['value'][:-1])
-            except json.JSONDecodeError:
-                pass
 
 if __name__ == '__main__':
     server = TCP_server()
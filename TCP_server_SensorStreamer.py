@@ -1,30 +1,14 @@
-import json
-import math
 import socket
 import numpy as np
-from scipy.spatial.transform import Rotation as R
 
+from frame_reassembler import FrameReassembler
+from gyro import GyroscopeOrientation
+from orientation import rotvec_to_euler_scalar
+from recorder import get_recorder
+from sensor_decoder import SensorDecoder, times
 
-class GyroscopeOrientation:
-    def __init__(self):
-        self.dt = 0.02  # Time interval in seconds (10 ms - 0.02)
-        self.x_angle = 0  # Initial orientation angle around x-axis
-        self.y_angle = 0  # Initial orientation angle around y-axis
-        self.z_angle = 0  # Initial orientation angle around z-axis
-
-    def update_orientation(self, gyro_x, gyro_y, gyro_z):
-        # Integrate the gyroscope data to update the orientation angles
-        self.x_angle += gyro_x * self.dt
-        self.y_angle += gyro_y * self.dt
-        self.z_angle += gyro_z * self.dt
 
-        # Normalize the angles to keep them within the range of 0 to 2*pi
-        self.x_angle = self.x_angle % (2 * math.pi)
-        self.y_angle = self.y_angle % (2 * math.pi)
-        self.z_angle = self.z_angle % (2 * math.pi)
-
-    def get_gyro(self):
-        return self.x_angle, self.y_angle, self.z_angle
+PRINT_PACKETS = False  # Echo every received packet, slows down the receive loop considerably
 
 
 class RotationVector:
@@ -37,8 +21,7 @@ class RotationVector:
         self.x = x
         self.y = y
         self.z = z
-        r = R.from_rotvec([x, y, z])
-        self.z, self.x, self.y = r.as_euler('x,y,z', degrees=True)
+        self.z, self.x, self.y = rotvec_to_euler_scalar(x, y, z, degrees=True)
 
     def get_rotation_vec(self):
         return self.x, self.y, self.z
@@ -56,8 +39,12 @@ class TCP_server:
         self.client_socket = None
         self.addr = None
         self.received_data = list()
-        self.gyro = GyroscopeOrientation()
+        self.gyro = GyroscopeOrientation(dt=0.02)
         self.rot_vec = RotationVector()
+        # Frames split across reads are kept until complete, every frame is decoded once
+        self.reassembler = FrameReassembler()
+        self.decoder = SensorDecoder()
+        self.angles_log = get_recorder().channel('phone_angles.txt', 3)
 
         self.__init_connection()
         self.__transmit_data()
@@ -72,7 +59,8 @@ class TCP_server:
         # Receive data from the client (your Android app)
         while True:
             data = self.client_socket.recv(1024)  # Change the buffer size as needed
-            print(data)
+            if PRINT_PACKETS:
+                print(data)
             if not data:
                 break
             # self.extract_gyro(data)
@@ -80,37 +68,23 @@ class TCP_server:
             self.extract_rotation_vector(data)
             x, y, z = self.rot_vec.get_rotation_vec()
             # print(x, y, z)
-            with open(r"C:\Users\Admin\Desktop\phone_angles.txt", 'a') as f:
-                txt = ';'.join([str(x), str(y), str(z)])
-                txt += '\n'
-                f.write(txt)
+            self.angles_log.append((x, y, z))
         # self.client_socket.close()
 
+    def decode(self, data):
+        self.reassembler.feed(data)
+        self.decoder.feed(self.reassembler)
+        return self.decoder.take()
+
     def extract_gyro(self, data):
-        entries = data.decode('utf-8').split('\n')
-        for entry in entries:
-            try:
-                json_data = json.loads(entry)
-                if 'gyroscope' in json_data:
-                    gyroscope_value = json_data['gyroscope'].get('value')
-                    if gyroscope_value:
-                        self.gyro.update_orientation(*gyroscope_value)
-            except json.JSONDecodeError:
-                pass
+        gyro = self.decode(data).get('gyroscope')
+        if gyro is not None:
+            self.gyro.update_block(times(gyro), gyro[1])
 
     def extract_rotation_vector(self, data):
-        entries = data.decode('utf-8').split('\n')
-        for entry in entries:
-            try:
-                json_data = json.loads(entry)
-                if 'rotationVector' in json_data:
-                    rot_vec_value = json_data['rotationVector'].get('value')
-                    if rot_vec_value:
-                        self.rot_vec.update(*rot_vec_value)
-                elif 'value' in json_data:
-                    self.rot_vec.update(*json_data['value'])
-            except json.JSONDecodeError:
-                pass
+        rotvec = self.decode(data).get('rotvec')
+        if rotvec is not None:
+            self.rot_vec.update(*rotvec[1][-1].tolist())
 
 
 if __name__ == '__main__':
@@ -1,14 +1,30 @@
 import dash
-from dash.dependencies import Output, Input
+from dash.dependencies import ClientsideFunction, Output, Input, State
+from dash.exceptions import PreventUpdate
 from dash import dcc, html, dcc
 from datetime import datetime
 import json
 import plotly.graph_objs as go
-from collections import deque
-from flask import Flask, request
+from flask import Flask, Response, request
 import logging
 from flask.logging import default_handler
-import math
+import itertools
+import threading
+
+import numpy as np
+
+from decimation import Decimator
+from figure_cache import GenerationCache
+from flow_control import BoundedBuffer
+from fusion import FusionBank
+from gyro import GyroscopeOrientation
+import metrics
+from metrics import CALLBACK_SECONDS
+from orientation import quaternion_to_euler, quaternion_to_euler_scalar
+from recorder import get_recorder
+from resampling import Resampler
+from ring_buffer import RingBuffer
+from sensor_decoder import SensorDecoder
 
 
 server = Flask(__name__)
@@ -16,29 +32,82 @@ app = dash.Dash(__name__, server=server)
 app.logger.removeHandler(default_handler)
 app.logger.setLevel(logging.ERROR)
 
-MAX_DATA_POINTS = 1000
-UPDATE_FREQ_MS = 1000
+MAX_DATA_POINTS = 100000
+# Traces are reduced to about LOD_POINTS points each, LOD_MODE is "minmax" or "lttb"
+LOD_POINTS = 4000
+LOD_MODE = "minmax"
+# Incremental mode sends only the new samples through extendData, so it can refresh much faster
+INCREMENTAL_UPDATES = True
+UPDATE_FREQ_MS = 50 if INCREMENTAL_UPDATES else 1000
+# Push mode: after the first figure, new points are streamed to the browser over server-sent events (/stream)
+# and appended by assets/live_push.js, there is no interval polling
+PUSH_UPDATES = False
+SSE_KEEPALIVE_S = 15
+PRINT_SAMPLES = False  # Echo every received sample, costly at high sample rates
+# Samples buffered between /data and the processing thread, and what to shed when it is full:
+# "block", "drop_oldest", "decimate" (to INGEST_RATE_HZ per sensor) or "priority" (SENSOR_PRIORITY, higher is kept)
+INGEST_BUFFER = 20000
+INGEST_POLICY = "priority"
+INGEST_RATE_HZ = 100
+SENSOR_PRIORITY = {"orientation": 2, "gyroscope": 1, "gravity": 1, "accelerometer": 0}
+# Built figures and updates kept per data generation, shared by all browser tabs
+FIGURE_CACHE_SIZE = 64
+# Common clock of the aligned sensor frames, and the streams aligned onto it
+RESAMPLE_HZ = 100
+RESAMPLE_STREAMS = {"acc": (3, "linear"), "gyro": (3, "linear"), "gravity": (3, "linear"), "orientation": (4, "slerp")}
+
+time = RingBuffer(MAX_DATA_POINTS, dtype="datetime64[us]", track_extrema=False)
+gyro_time = RingBuffer(MAX_DATA_POINTS, dtype="datetime64[us]", track_extrema=False)
+
+# The running min/max only feed the axis ranges of full figures, incremental mode lets plotly autorange
+TRACK_EXTREMA = not INCREMENTAL_UPDATES
+accel_x = RingBuffer(MAX_DATA_POINTS, track_extrema=TRACK_EXTREMA)
+accel_y = RingBuffer(MAX_DATA_POINTS, track_extrema=TRACK_EXTREMA)
+accel_z = RingBuffer(MAX_DATA_POINTS, track_extrema=TRACK_EXTREMA)
+
+gyro_x = RingBuffer(MAX_DATA_POINTS, track_extrema=TRACK_EXTREMA)
+gyro_y = RingBuffer(MAX_DATA_POINTS, track_extrema=TRACK_EXTREMA)
+gyro_z = RingBuffer(MAX_DATA_POINTS, track_extrema=TRACK_EXTREMA)
 
-time = deque(maxlen=MAX_DATA_POINTS)
+qw = RingBuffer(MAX_DATA_POINTS, track_extrema=False)
+qx = RingBuffer(MAX_DATA_POINTS, track_extrema=False)
+qy = RingBuffer(MAX_DATA_POINTS, track_extrema=False)
+qz = RingBuffer(MAX_DATA_POINTS, track_extrema=False)
 
-accel_x = deque(maxlen=MAX_DATA_POINTS)
-accel_y = deque(maxlen=MAX_DATA_POINTS)
-accel_z = deque(maxlen=MAX_DATA_POINTS)
+accel_lod = [Decimator(MAX_DATA_POINTS, LOD_POINTS, LOD_MODE) for _ in range(3)]
+gyro_lod = [Decimator(MAX_DATA_POINTS, LOD_POINTS, LOD_MODE) for _ in range(3)]
+# Held by the ingest thread while it appends to the plotted buffers and by the callbacks while they read them
+# and update the per bucket caches of the decimators, so a reader never sees a half written append
+buffers_lock = threading.Lock()
 
-gyro_x = deque(maxlen=MAX_DATA_POINTS)
-gyro_y = deque(maxlen=MAX_DATA_POINTS)
-gyro_z = deque(maxlen=MAX_DATA_POINTS)
+# Integrated gyroscope orientation of every device, keyed like the resamplers
+gyroscopes = dict()
+# Gyroscope and gravity fusion for every phone posting to /data, keyed by the payload deviceId.
+# Sensor Logger's "accelerometer" stream has gravity removed, the tilt correction uses its "gravity" stream
+fusion = FusionBank(method="madgwick")
+# Every device's sensors are resampled onto one clock before plotting and fusion
+resamplers = dict()
+decoder = SensorDecoder()  # Only used by the ingest thread
+# Bumped by the ingest thread whenever the plotted buffers change
+data_generation = 0
+generation_changed = threading.Condition()
+figure_cache = GenerationCache(FIGURE_CACHE_SIZE)
 
-qw = deque(maxlen=MAX_DATA_POINTS)
-qx = deque(maxlen=MAX_DATA_POINTS)
-qy = deque(maxlen=MAX_DATA_POINTS)
-qz = deque(maxlen=MAX_DATA_POINTS)
+angles_log = get_recorder().channel('phone_angles.txt', 3)
+fused_angles_log = get_recorder().channel('fused_angles.txt', 3)
+ingest = BoundedBuffer(INGEST_BUFFER, INGEST_POLICY, rate_hz=INGEST_RATE_HZ)
+
+payload_bytes = metrics.counter("imu_bytes_received_total", "Bytes read from sensor connections")
+payload_samples = metrics.counter("imu_samples_received_total", "Sensor samples received in /data payloads")
 
 app.layout = html.Div(
     [
         dcc.Graph(id="live_graph"),
         dcc.Graph(id="gyro_graph"),  # New gyroscope graph
-        dcc.Interval(id="counter", interval=UPDATE_FREQ_MS),
+        # Disabled in push mode, the callback still runs once on page load
+        dcc.Interval(id="counter", interval=UPDATE_FREQ_MS, disabled=PUSH_UPDATES),
+        dcc.Store(id="sync"),  # Per client high-water marks of the samples already sent
+        dcc.Store(id="push"),
     ]
 )
 
@@ -50,34 +119,55 @@ def euler_from_quaternion(x, y, z, w):
     pitch is rotation around y in radians (counterclockwise)
     yaw is rotation around z in radians (counterclockwise)
     """
-    t0 = +2.0 * (w * x + y * z)
-    t1 = +1.0 - 2.0 * (x * x + y * y)
-    roll_x = math.atan2(t0, t1)
+    roll_x, pitch_y, yaw_z = quaternion_to_euler_scalar(x, y, z, w)
 
-    t2 = +2.0 * (w * y - z * x)
-    t2 = +1.0 if t2 > +1.0 else t2
-    t2 = -1.0 if t2 < -1.0 else t2
-    pitch_y = math.asin(t2)
+    return roll_x, pitch_y, yaw_z  # in radians
 
-    t3 = +2.0 * (w * z + x * y)
-    t4 = +1.0 - 2.0 * (y * y + z * z)
-    yaw_z = math.atan2(t3, t4)
+def decimated_traces(t, traces, decimators):
+    """
+    Level of detail reduced traces of one sensor.
+    Returns the x and y arrays of every trace, the global sample number of every point of every trace,
+    the number of samples in final buckets, and the raw samples after them as (x, [y of every trace]).
+    Only final buckets are in the traces, the open ones are the raw tail.
+    """
+    with buffers_lock:
+        # Buffers of one sensor are appended one after another, cut them all at the same sample
+        count = min(b.count for b in (t, *traces))
+        length = min(len(b) - (b.count - count) for b in (t, *traces))
+        first = count - length
 
-    return roll_x, pitch_y, yaw_z  # in radians
+        def window(b):
+            stop = len(b) - (b.count - count)
+            return b.view()[stop - length:stop]
+
+        tv = window(t)
+        xs, ys, points, tail_ys = [], [], [], []
+        for d, decimator in zip(traces, decimators):
+            yv = window(d)
+            indices, _ = decimator.select(tv, yv, first)
+            # Copies, the buffers keep changing under the views
+            xs.append(tv[indices])
+            ys.append(yv[indices])
+            points.append(indices + first)
+        final_until = decimators[0].final_sample
+        tail_start = max(0, final_until - first)
+        tail_x = tv[tail_start:].copy()
+        tail_ys = [window(d)[tail_start:].copy() for d in traces]
+    return xs, ys, points, final_until, (tail_x, tail_ys)
+
+
+def build_figures():
+    accel_xs, accel_ys, _, accel_sent, _ = decimated_traces(time, [accel_x, accel_y, accel_z], accel_lod)
+    gyro_xs, gyro_ys, _, gyro_sent, _ = decimated_traces(gyro_time, [gyro_x, gyro_y, gyro_z], gyro_lod)
 
-@app.callback(
-    [Output("live_graph", "figure"), Output("gyro_graph", "figure")],
-    Input("counter", "n_intervals"),
-)
-def update_graph(_counter):
     accel_data = [
-        go.Scatter(x=list(time), y=list(d), name=name)
-        for d, name in zip([accel_x, accel_y, accel_z], ["X", "Y", "Z"])
+        go.Scatter(x=x, y=y, name=name)
+        for x, y, name in zip(accel_xs, accel_ys, ["X", "Y", "Z"])
     ]
 
     gyro_data = [
-        go.Scatter(x=list(time), y=list(d), name=name)
-        for d, name in zip([gyro_x, gyro_y, gyro_z], ["X", "Y", "Z"])
+        go.Scatter(x=x, y=y, name=name)
+        for x, y, name in zip(gyro_xs, gyro_ys, ["X", "Y", "Z"])
     ]
 
     accel_graph = {
@@ -99,85 +189,304 @@ def update_graph(_counter):
             }
         ),
     }
+    sync = {"accel": accel_sent, "gyro": gyro_sent}
+
+    if INCREMENTAL_UPDATES:
+        # extendData does not touch the layout, let plotly autorange as traces grow
+        return accel_graph, gyro_graph, sync
+
+    with buffers_lock:
+        if len(time) > 0:
+            # The time window is sorted, the value ranges come from the running window min/max
+            accel_graph["layout"]["xaxis"]["range"] = [time[0], time.last()]
+            accel_graph["layout"]["yaxis"]["range"] = [
+                min(accel_x.min(), accel_y.min(), accel_z.min()),
+                max(accel_x.max(), accel_y.max(), accel_z.max()),
+            ]
+
+        if len(gyro_time) > 0:
+            gyro_graph["layout"]["xaxis"]["range"] = [gyro_time[0], gyro_time.last()]
+            gyro_graph["layout"]["yaxis"]["range"] = [
+                min(gyro_x.min(), gyro_y.min(), gyro_z.min()),
+                max(gyro_x.max(), gyro_y.max(), gyro_z.max()),
+            ]
+
+    return accel_graph, gyro_graph, sync
+
+
+def new_samples(t, traces, decimators, sent, provisional=False):
+    """
+    Points of the buckets finalized since the client's high-water mark `sent` (a global sample number),
+    as extendData for the traces. With provisional, the raw samples of the open buckets are added as
+    "tail_x" and "tail_y", the client replaces them with the next update.
+    Returns (extend_data, new high-water mark), extend_data is None when the client needs a resync.
+    """
+    xs, ys, points, final_until, (tail_x, tail_ys) = decimated_traces(t, traces, decimators)
+    if sent > final_until:
+        return None, final_until
+    if sent == final_until and not provisional:
+        return dash.no_update, sent
+    # Per trace, min and max points of one bucket differ between traces
+    starts = [np.searchsorted(p, sent) for p in points]
+    extend = dict(x=[x[start:] for x, start in zip(xs, starts)], y=[y[start:] for y, start in zip(ys, starts)])
+    if provisional:
+        extend.update(tail_x=tail_x, tail_y=tail_ys)
+    return (extend, list(range(len(traces))), LOD_POINTS), final_until
+
+
+@app.callback(
+    [
+        Output("live_graph", "figure"),
+        Output("live_graph", "extendData"),
+        Output("gyro_graph", "figure"),
+        Output("gyro_graph", "extendData"),
+        Output("sync", "data"),
+    ],
+    Input("counter", "n_intervals"),
+    State("sync", "data"),
+)
+def update_graph(_counter, sync):
+    with CALLBACK_SECONDS.time():
+        return _update_graph(sync)
+
+
+def incremental_update(sync, provisional=False):
+    # extendData for both graphs and the new high-water marks, None when the client needs a resync
+    accel_extend, accel_sent = new_samples(time, [accel_x, accel_y, accel_z], accel_lod, sync["accel"], provisional)
+    gyro_extend, gyro_sent = new_samples(gyro_time, [gyro_x, gyro_y, gyro_z], gyro_lod, sync["gyro"], provisional)
+    if accel_extend is None or gyro_extend is None:
+        return None
+    return accel_extend, gyro_extend, {"accel": accel_sent, "gyro": gyro_sent}
+
+
+def _update_graph(sync):
+    no_update = dash.no_update
+    generation = data_generation
+    if sync is not None and sync.get("generation") == generation:
+        # Nothing arrived since this client's last update
+        raise PreventUpdate
+
+    # Clients on the same generation (and high-water marks) share one build
+    if INCREMENTAL_UPDATES and sync is not None:
+        key = ("extend", generation, sync["accel"], sync["gyro"])
+        update = figure_cache.get_or_build(key, lambda: incremental_update(sync))
+        if update is not None:
+            accel_extend, gyro_extend, new_sync = update
+            return no_update, accel_extend, no_update, gyro_extend, dict(new_sync, generation=generation)
+
+    # First load or resync, the client gets the whole window
+    accel_graph, gyro_graph, new_sync = figure_cache.get_or_build(("full", generation), build_figures)
+    return accel_graph, no_update, gyro_graph, no_update, dict(new_sync, generation=generation)
+
+
+if PUSH_UPDATES:
+    app.clientside_callback(
+        ClientsideFunction(namespace="live", function_name="connect"),
+        Output("push", "data"),
+        Input("sync", "data"),
+    )
+
+
+def extend_json(extend):
+    # extendData of new_samples as JSON for the browser, dates as strings like the figure axes
+    if extend is dash.no_update:
+        return None
+    data, traces, max_points = extend
+    event = {
+        "x": [np.datetime_as_string(x, unit="us").tolist() for x in data["x"]],
+        "y": [y.tolist() for y in data["y"]],
+        "traces": traces,
+        "max_points": max_points,
+    }
+    if "tail_x" in data:
+        event["tail_x"] = np.datetime_as_string(data["tail_x"], unit="us").tolist()
+        event["tail_y"] = [y.tolist() for y in data["tail_y"]]
+    return event
 
-    if len(time) > 0:
-        accel_graph["layout"]["xaxis"]["range"] = [min(time), max(time)]
-        accel_graph["layout"]["yaxis"]["range"] = [
-            min(accel_x + accel_y + accel_z),
-            max(accel_x + accel_y + accel_z),
-        ]
 
-        gyro_graph["layout"]["xaxis"]["range"] = [min(time), max(time)]
-        gyro_graph["layout"]["yaxis"]["range"] = [
-            min(gyro_x + gyro_y + gyro_z),
-            max(gyro_x + gyro_y + gyro_z),
-        ]
+def sse_event(generation, accel_sent, gyro_sent):
+    """
+    Server-sent event text with the points after the given high-water marks, and the new marks.
+    The samples of the open buckets go along as provisional points, so they show up one ingest period
+    after they arrive instead of once their bucket is final.
+    Returns None when the client fell out of the window and has to reload.
+    """
+    update = incremental_update({"accel": accel_sent, "gyro": gyro_sent}, provisional=True)
+    if update is None:
+        return None
+    accel_extend, gyro_extend, sync = update
+    if accel_extend is dash.no_update and gyro_extend is dash.no_update:
+        return "", sync["accel"], sync["gyro"]
+    payload = json.dumps({"accel": extend_json(accel_extend), "gyro": extend_json(gyro_extend)})
+    event_id = f"{generation},{sync['accel']},{sync['gyro']}"
+    return f"id: {event_id}\nevent: update\ndata: {payload}\n\n", sync["accel"], sync["gyro"]
+
+
+def stream_updates(generation, accel_sent, gyro_sent):
+    while True:
+        with generation_changed:
+            if data_generation == generation:
+                generation_changed.wait(SSE_KEEPALIVE_S)
+            current = data_generation
+        if current == generation:
+            # Keeps proxies from closing an idle stream
+            yield ": keepalive\n\n"
+            continue
+        # Clients at the same marks share one serialized event
+        key = ("sse", current, accel_sent, gyro_sent)
+        event = figure_cache.get_or_build(key, lambda: sse_event(current, accel_sent, gyro_sent))
+        if event is None:
+            yield "event: resync\ndata: {}\n\n"
+            return
+        text, accel_sent, gyro_sent = event
+        generation = current
+        if text:
+            yield text
+
 
-    return accel_graph, gyro_graph
+@server.route("/stream")
+def stream():
+    # The browser resends the id of the last event when it reconnects, it wins over the query string
+    last_event = request.headers.get("Last-Event-ID")
+    if last_event:
+        generation, accel_sent, gyro_sent = (int(v) for v in last_event.split(","))
+    else:
+        generation = int(request.args.get("generation", -1))
+        accel_sent = int(request.args.get("accel", 0))
+        gyro_sent = int(request.args.get("gyro", 0))
+    return Response(stream_updates(generation, accel_sent, gyro_sent), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @server.route("/data", methods=["POST"])
 def data():  # listens to the data streamed from the sensor logger
     if str(request.method) == "POST":
         # print(f'received data: {request.data}')
+        payload_bytes.inc(len(request.data))
         data = json.loads(request.data)
+        payload_samples.inc(len(data["payload"]))
+        device = data.get("deviceId")
+        # Samples are queued for the processing thread, the phone gets its answer right away
         for d in data["payload"]:
-            if d.get("name", None) == "accelerometer":
-                ts = datetime.fromtimestamp(d["time"] / 1000000000)
-                if len(time) == 0 or ts > time[-1]:
-                    time.append(ts)
-                    accel_x.append(d["values"]["x"])
-                    accel_y.append(d["values"]["y"])
-                    accel_z.append(d["values"]["z"])
-
-            elif d.get("name", None) == "orientation":  # Process gyroscope data
-                qw.append(d["values"]["qw"])
-                qx.append(d["values"]["qx"])
-                qy.append(d["values"]["qy"])
-                qz.append(d["values"]["qz"])
-                print(qw[-1], qx[-1], qy[-1], qz[-1])
-                x, y, z = euler_from_quaternion(qx[-1], qy[-1], qz[-1], qw[-1])
-                print(x, y, z)
-                with open(r"C:\Users\Admin\Desktop\phone_angles.txt", 'a') as f:
-                    txt = ';'.join([str(x), str(y), str(z)])
-                    txt += '\n'
-                    f.write(txt)
-
-            elif d.get("name", None) == "gyroscope":  # Process gyroscope data
-                gyro_x.append(d["values"]["x"])
-                gyro_y.append(d["values"]["y"])
-                gyro_z.append(d["values"]["z"])
-                gyroscope.update_orientation(gyro_x[-1], gyro_y[-1], gyro_z[-1])
-                x, y, z = gyroscope.get_g()
-                print(gyro_x[-1], gyro_y[-1], gyro_z[-1])
-                with open(r"C:\Users\Admin\Desktop\phone_angles.txt", 'a') as f:
-                    txt = ';'.join([str(x), str(y), str(z)])
-                    txt += '\n'
-                    f.write(txt)
+            name = d.get("name", None)
+            ingest.put((device, d), sensor=(device, name), timestamp=d.get("time", 0) / 1e9,
+                       priority=SENSOR_PRIORITY.get(name, 0))
 
     return "success"
 
-class GyroscopeOrientation:
-    def __init__(self):
-        self.dt = 0.01  # Time interval in seconds
-        self.x_angle = 0  # Initial orientation angle around x-axis
-        self.y_angle = 0  # Initial orientation angle around y-axis
-        self.z_angle = 0  # Initial orientation angle around z-axis
 
-    def update_orientation(self, gyro_x, gyro_y, gyro_z):
-        # Integrate the gyroscope data to update the orientation angles
-        self.x_angle += gyro_x * self.dt
-        self.y_angle += gyro_y * self.dt
-        self.z_angle += gyro_z * self.dt
+def local_datetime64(seconds):
+    # Epoch seconds to naive local times, like datetime.fromtimestamp
+    offset = datetime.fromtimestamp(seconds[0]).astimezone().utcoffset().total_seconds()
+    return ((seconds + offset) * 1e6).astype("int64").astype("datetime64[us]")
+
+
+def process_samples(device, samples):
+    # Samples are decoded into columns per sensor (sensor_decoder.SAMPLE_SCHEMAS) and aligned onto
+    # the RESAMPLE_HZ clock of the device, returns the aligned frames or None
+    decoder.decode_samples(samples)
+    resampler = resamplers.get(device)
+    if resampler is None:
+        resampler = resamplers[device] = Resampler(RESAMPLE_HZ, RESAMPLE_STREAMS)
+    for stream, (times, values) in decoder.take().items():
+        if stream in resampler.streams:
+            resampler.add(stream, times, values)
+    return resampler.step()
+
+
+def process_frames(device, frames):
+    """
+    Aligned frames of one device: "time" in seconds and an array per sensor stream with samples.
+    """
+    global data_generation
+    t = local_datetime64(frames["time"])
+    time_ns = frames["time"] * 1e9
+    if PRINT_SAMPLES:
+        print(device, {name: values[-1] for name, values in frames.items()})
+
+    if "acc" in frames:
+        # Devices share the plots, only samples newer than the plotted ones are added
+        new = t > time.last() if len(time) else np.ones(len(t), dtype=bool)
+        acc = frames["acc"][new]
+        with buffers_lock:
+            time.extend(t[new])
+            accel_x.extend(acc[:, 0])
+            accel_y.extend(acc[:, 1])
+            accel_z.extend(acc[:, 2])
+
+    if "orientation" in frames:
+        q = frames["orientation"]
+        qx.extend(q[:, 0])
+        qy.extend(q[:, 1])
+        qz.extend(q[:, 2])
+        qw.extend(q[:, 3])
+        angles_log.extend(quaternion_to_euler(q))
+
+    if "gyro" in frames:
+        gyro = frames["gyro"]
+        gyroscope = gyroscopes.get(device)
+        if gyroscope is None:
+            gyroscope = gyroscopes[device] = GyroscopeOrientation()
+        # Every sample of the device is integrated, like the accelerations only newer ones are plotted
+        integrated = gyroscope.update_block(time_ns, gyro)
+        new = t > gyro_time.last() if len(gyro_time) else np.ones(len(t), dtype=bool)
+        with buffers_lock:
+            gyro_time.extend(t[new])
+            gyro_x.extend(gyro[new, 0])
+            gyro_y.extend(gyro[new, 1])
+            gyro_z.extend(gyro[new, 2])
+        # Euler angles of the integrated orientation, within 0 to 2*pi like GyroscopeOrientation.get_g
+        angles_log.extend(quaternion_to_euler(integrated[new]) % (2 * np.pi))
+    with generation_changed:
+        data_generation += 1
+        generation_changed.notify_all()
+
+
+def fuse_frames(aligned):
+    """
+    Fusion of the aligned frames of every device in an ingest batch with one FusionBank.update call,
+    the devices share the RESAMPLE_HZ clock so every round steps all of them together.
+    """
+    aligned = [(device, frames) for device, frames in aligned if "gyro" in frames and "gravity" in frames]
+    if not aligned:
+        return
+    keys = [device for device, frames in aligned for _ in range(len(frames["time"]))]
+    fused = fusion.update(keys, np.concatenate([frames["time"] for _, frames in aligned]) * 1e9,
+                          np.concatenate([frames["gyro"] for _, frames in aligned]),
+                          np.concatenate([frames["gravity"] for _, frames in aligned]))
+    fused_angles_log.extend(quaternion_to_euler(fused))
+
+
+def process_ingest():
+    while True:
+        batch = ingest.get_batch(1024)
+        if batch is None:
+            break
+        # Consecutive samples of one device are processed together
+        aligned = []
+        for device, group in itertools.groupby(batch, key=lambda item: item[0]):
+            frames = process_samples(device, [d for _, d in group])
+            if frames is not None:
+                process_frames(device, frames)
+                aligned.append((device, frames))
+        fuse_frames(aligned)
+
+
+threading.Thread(target=process_ingest, name="ingest", daemon=True).start()
+
+
+@server.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 
-        # Normalize the angles to keep them within the range of 0 to 2*pi
-        self.x_angle = self.x_angle % (2 * math.pi)
-        self.y_angle = self.y_angle % (2 * math.pi)
-        self.z_angle = self.z_angle % (2 * math.pi)
+if metrics.profiling_enabled():
+    @server.route("/profile")
+    def sampling_profile():
+        # Folded stacks of the next ?seconds=N (default 5), for flamegraph.pl or speedscope
+        seconds = min(float(request.args.get("seconds", 5)), 60)
+        return Response(metrics.profile(seconds), mimetype="text/plain")
 
-    def get_g(self):
-        return self.x_angle, self.y_angle, self.z_angle
 
 if __name__ == "__main__":
-    gyroscope = GyroscopeOrientation()
     app.run_server(port=8000, host="0.0.0.0")
@@ -1,21 +1,28 @@
-import math
-
-import websocket
+import asyncio
 import json
 
+from gyro import GyroscopeOrientation
+from recorder import get_recorder
+
+angles_log = get_recorder().channel('phone_angles.txt', 3)
+
+# The async client records several sensors of several phones on one event loop (see ws_client)
+ASYNC_CLIENT = True
+PHONES = ["192.168.0.140:8080"]
+SENSORS = ["android.sensor.orientation", "android.sensor.gyroscope", "android.sensor.accelerometer"]
+PRINT_SAMPLES = False  # Echo every sample, slows down the receive loop considerably
+
 
 def on_message(ws, message):
     values = json.loads(message)['values']
     x = values[0]
     y = values[1]
     z = values[2]
-    # gyroscope.update_orientation(x, y, z)
+    # gyroscope.update_orientation(x, y, z, json.loads(message)['timestamp'])
     # x, y, z = gyroscope.get_g()
-    with open(r"C:\Users\Admin\Desktop\phone_angles.txt", 'a') as f:
-        txt = ';'.join([str(x), str(y), str(z)])
-        txt += '\n'
-        f.write(txt)
-    print("x = ", x, "y = ", y, "z = ", z)
+    angles_log.append((x, y, z))
+    if PRINT_SAMPLES:
+        print("x = ", x, "y = ", y, "z = ", z)
 
 
 def on_error(ws, error):
@@ -28,28 +35,10 @@ def on_close(ws, close_code, reason):
 
 def on_open(ws):
     print("connected")
-class GyroscopeOrientation:
-    def __init__(self):
-        self.dt = 0.01  # Time interval in seconds
-        self.x_angle = 0  # Initial orientation angle around x-axis
-        self.y_angle = 0  # Initial orientation angle around y-axis
-        self.z_angle = 0  # Initial orientation angle around z-axis
-
-    def update_orientation(self, gyro_x, gyro_y, gyro_z):
-        # Integrate the gyroscope data to update the orientation angles
-        self.x_angle += gyro_x * self.dt
-        self.y_angle += gyro_y * self.dt
-        self.z_angle += gyro_z * self.dt
-
-        # Normalize the angles to keep them within the range of 0 to 2*pi
-        self.x_angle = self.x_angle % (2 * math.pi)
-        self.y_angle = self.y_angle % (2 * math.pi)
-        self.z_angle = self.z_angle % (2 * math.pi)
-
-    def get_g(self):
-        return self.x_angle, self.y_angle, self.z_angle
+
 
 def connect(url):
+    import websocket
     ws = websocket.WebSocketApp(url,
                                 on_open=on_open,
                                 on_message=on_message,
@@ -58,5 +47,14 @@ def connect(url):
 
     ws.run_forever()
 
+def on_sample(stream, sample):
+    if stream.sensor == "android.sensor.orientation":
+        angles_log.append(sample["values"][:3])
+
+
 gyroscope = GyroscopeOrientation()
-connect("ws://192.168.0.140:8080/sensor/connect?type=android.sensor.orientation")
+if ASYNC_CLIENT:
+    from ws_client import MultiSensorClient
+    asyncio.run(MultiSensorClient(PHONES, SENSORS, on_sample=on_sample).run())
+else:
+    connect("ws://192.168.0.140:8080/sensor/connect?type=android.sensor.orientation")
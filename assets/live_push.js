@@ -0,0 +1,52 @@
+// Push mode of app.py (PUSH_UPDATES): new points arrive as server-sent events and are appended to the graphs
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    live: {
+        connect: function (sync) {
+            // Opens the stream once, from the high-water marks of the first figure
+            if (!sync || window.imuLiveSource) {
+                return window.dash_clientside.no_update;
+            }
+            var url = "/stream?generation=" + sync.generation + "&accel=" + sync.accel + "&gyro=" + sync.gyro;
+            var source = new EventSource(url);
+            window.imuLiveSource = source;
+            source.addEventListener("update", function (event) {
+                var update = JSON.parse(event.data);
+                extendGraph("live_graph", update.accel);
+                extendGraph("gyro_graph", update.gyro);
+            });
+            source.addEventListener("resync", function () {
+                // The window moved past this page's points, start over with a fresh figure
+                source.close();
+                window.location.reload();
+            });
+            return window.dash_clientside.no_update;
+        }
+    }
+});
+
+function extendGraph(id, update) {
+    if (!update) {
+        return;
+    }
+    var graph = document.getElementById(id);
+    var plot = graph && graph.querySelector(".js-plotly-plot");
+    if (!plot) {
+        return;
+    }
+    // The provisional points of the last update (samples of buckets that were still open) are replaced
+    var previous = plot.imuProvisional || [];
+    var x = [], y = [], provisional = [];
+    update.traces.forEach(function (trace, i) {
+        var n = previous[i] || 0;
+        if (n) {
+            plot.data[trace].x.splice(-n, n);
+            plot.data[trace].y.splice(-n, n);
+        }
+        var tailY = update.tail_y ? update.tail_y[i] : [];
+        x.push(update.x[i].concat(update.tail_x || []));
+        y.push(update.y[i].concat(tailY));
+        provisional.push(tailY.length);
+    });
+    plot.imuProvisional = provisional;
+    Plotly.extendTraces(plot, {x: x, y: y}, update.traces, update.max_points);
+}
@@ -0,0 +1,107 @@
+import asyncio
+import socket
+
+from frame_reassembler import FrameReassembler
+from metrics import StatsReporter, install_profile_signal
+from recorder import OUTPUT_DIR
+from sensor_decoder import SensorDecoder, apply_motion
+from TCP_server import RotationVector, LinearAcceleration
+
+
+class DeviceSession:
+    """
+    State of a single connected device, every connection gets its own
+    rotation vector, linear acceleration and frame buffer.
+    frame_schemas replaces sensor_decoder.FRAME_SCHEMAS for the JSON frames.
+    """
+
+    def __init__(self, addr, frame_schemas=None):
+        self.addr = addr
+        self.rot_vec = RotationVector()
+        self.linear_acc = LinearAcceleration()
+        self.reassembler = FrameReassembler()
+        self.decoder = SensorDecoder() if frame_schemas is None else SensorDecoder(frame_schemas)
+        self.last_frame = None
+
+    def extract_sensor_data(self):
+        self.decoder.feed(self.reassembler)
+        self.last_frame = self.decoder.last_frame
+        apply_motion(self.decoder.take(), self.rot_vec, self.linear_acc)
+
+
+class DeviceProtocol(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.session = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.session = DeviceSession(transport.get_extra_info('peername'))
+        self.server.add_session(self.session)
+
+    def data_received(self, data):
+        self.session.reassembler.feed(data)
+        self.session.extract_sensor_data()
+        self.server.on_update(self.session)
+
+    def connection_lost(self, exc):
+        self.server.remove_session(self.session)
+        self.transport = None
+
+
+class AsyncTCPServer:
+    """
+    Multi client ingest server, handles any number of devices on one event loop.
+    on_update is called with the DeviceSession after each received chunk, on_disconnect when it closes.
+    """
+
+    def __init__(self, host=None, port=9885, on_update=None, on_disconnect=None):
+        self.host = host if host is not None else socket.gethostname()
+        self.port = port
+        self.sessions = dict()
+        self.update_callback = on_update
+        self.disconnect_callback = on_disconnect
+        self.server = None
+
+    def add_session(self, session):
+        # A reconnecting device gets a new peer address and starts with a fresh state
+        self.sessions[session.addr] = session
+        print("Successfully Connected to ", session.addr, "| devices:", len(self.sessions))
+
+    def remove_session(self, session):
+        self.sessions.pop(session.addr, None)
+        if self.disconnect_callback is not None:
+            self.disconnect_callback(session)
+        print("Connection closed", session.addr, session.reassembler.get_stats(),
+              "| devices:", len(self.sessions))
+
+    def on_update(self, session):
+        if self.update_callback is not None:
+            self.update_callback(session)
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(lambda: DeviceProtocol(self), self.host, self.port)
+        print(f"Server Listening on, {self.host}, port {self.port}")
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+if __name__ == '__main__':
+    server = AsyncTCPServer()
+    StatsReporter().start()
+    install_profile_signal(OUTPUT_DIR)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
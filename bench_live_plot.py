@@ -0,0 +1,79 @@
+import time
+
+import matplotlib
+
+matplotlib.use('Agg')  # Offscreen, measures the rendering without a window
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from decimation import Decimator
+from live_plot import LivePlot
+
+RATE_HZ = 200
+WINDOW_ROWS = 5000
+LOD_POINTS = 2000
+FRAMES = 300
+
+
+def stream(rows_per_frame):
+    # Sine traces and a slowly turning orientation, the first call fills the window, then rows_per_frame samples
+    state = {'count': 0}
+
+    def read_new():
+        start = state['count']
+        n = rows_per_frame if start else WINDOW_ROWS
+        t = (start + np.arange(n)) / RATE_HZ
+        state['count'] += n
+        rows = np.column_stack((t, np.sin(t), np.cos(2 * t), 0.5 * np.sin(3 * t)))
+        angle = t[-1] / 2
+        quaternion = np.array([0.0, 0.0, np.sin(angle), np.cos(angle)])
+        return rows, state['count'], quaternion
+    return read_new
+
+
+def replot_frames(read_new):
+    # The former clear-and-replot animation of test_plot.py
+    fig = plt.figure()
+    ax = fig.add_subplot(1, 1, 1)
+    lod = [Decimator(WINDOW_ROWS, LOD_POINTS, 'minmax') for _ in range(3)]
+    window = None
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        new, total, _ = read_new()
+        window = new if window is None else np.concatenate((window, new))[-WINDOW_ROWS:]
+        first = total - len(window)
+        ax.clear()
+        ax.set_xlim(window[-1, 0] - 7, window[-1, 0] + 7)
+        ax.set_ylim(-2, 2)
+        for axis, decimator in enumerate(lod, 1):
+            ax.plot(*decimator.decimate(window[:, 0], window[:, axis], first))
+        fig.canvas.draw()
+    plt.close(fig)
+    return (time.perf_counter() - start) / FRAMES
+
+
+def blitted_frames(read_new):
+    fig = plt.figure()
+    plot = LivePlot(fig, read_new, WINDOW_ROWS, LOD_POINTS, report_interval=float('inf'))
+    fig.canvas.draw()
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        plot.update()
+    elapsed = (time.perf_counter() - start) / FRAMES
+    plt.close(fig)
+    return elapsed
+
+
+def main():
+    # 60 frames per second of a 200 Hz stream
+    rows_per_frame = RATE_HZ // 60 + 1
+    replot = replot_frames(stream(rows_per_frame))
+    blitted = blitted_frames(stream(rows_per_frame))
+    print(f"{'replot':<8} {replot * 1e3:7.2f} ms/frame {1 / replot:6.0f} fps max")
+    print(f"{'blitted':<8} {blitted * 1e3:7.2f} ms/frame {1 / blitted:6.0f} fps max (with the 3D orientation view)")
+    print(f"blitting is {replot / blitted:.1f}x faster per frame")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import time
+
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+from orientation import quaternion_to_euler, rotvec_to_euler, rotvec_to_euler_scalar
+
+N = 100000  # Samples per vectorized run
+N_LOOP = 5000  # Samples for the per sample loops, they are much slower
+
+
+def per_sample_us(func, n):
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    rng = np.random.default_rng(0)
+    rotvecs = rng.uniform(-np.pi / 2, np.pi / 2, (N, 3))
+    quaternions = R.from_rotvec(rotvecs).as_quat()
+
+    # Check the kernel against scipy before timing it
+    expected = R.from_rotvec(rotvecs).as_euler('xyz', degrees=True)
+    assert np.allclose(rotvec_to_euler(rotvecs, degrees=True), expected)
+    assert np.allclose(rotvec_to_euler_scalar(*rotvecs[0], degrees=True), expected[0])
+
+    results = [
+        ("scipy Rotation per sample (old path)",
+         per_sample_us(lambda: [R.from_rotvec(rv).as_euler('xyz', degrees=True) for rv in rotvecs[:N_LOOP]], N_LOOP)),
+        ("scipy Rotation vectorized",
+         per_sample_us(lambda: R.from_rotvec(rotvecs).as_euler('xyz', degrees=True), N)),
+        ("kernel rotvec_to_euler per sample",
+         per_sample_us(lambda: [rotvec_to_euler(rv, degrees=True) for rv in rotvecs[:N_LOOP]], N_LOOP)),
+        ("kernel rotvec_to_euler_scalar per sample",
+         per_sample_us(lambda: [rotvec_to_euler_scalar(*rv, degrees=True) for rv in rotvecs[:N_LOOP].tolist()], N_LOOP)),
+        ("kernel rotvec_to_euler vectorized",
+         per_sample_us(lambda: rotvec_to_euler(rotvecs, degrees=True), N)),
+        ("kernel quaternion_to_euler vectorized",
+         per_sample_us(lambda: quaternion_to_euler(quaternions, degrees=True), N)),
+    ]
+    for name, cost in results:
+        print(f"{name:<42} {cost:10.3f} us/sample")
+
+
+if __name__ == '__main__':
+    main()
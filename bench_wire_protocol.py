@@ -0,0 +1,57 @@
+import json
+import time
+
+import numpy as np
+
+import wire_protocol
+from frame_reassembler import FrameReassembler
+
+N = 20000  # Samples, each with a rotation vector and a linear acceleration
+
+
+def timed(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    rng = np.random.default_rng(0)
+    timestamps = 1_700_000_000_000_000_000 + np.arange(N, dtype=np.int64) * 5_000_000
+    quaternions = rng.normal(size=(N, 4))
+    acc = rng.normal(size=(N, 3))
+
+    ndjson = ''.join(
+        json.dumps({'rotationVectorData': list(q) + [0.0], 'linearAccelerationData': list(a), 'timestamp': int(t)}) + '\n'
+        for q, a, t in zip(quaternions.tolist(), acc.tolist(), timestamps.tolist())
+    ).encode('utf-8')
+    binary = wire_protocol.STREAM_MAGIC + b''.join((
+        wire_protocol.encode_records(wire_protocol.SENSOR_ROTATION_VECTOR, timestamps, quaternions),
+        wire_protocol.encode_records(wire_protocol.SENSOR_LINEAR_ACCELERATION, timestamps, acc),
+    ))
+
+    def decode_json():
+        reassembler = FrameReassembler()
+        reassembler.feed(ndjson)
+        return list(reassembler.json_frames())
+
+    def decode_binary():
+        reassembler = FrameReassembler()
+        reassembler.feed(binary)
+        return reassembler.records()
+
+    json_time, frames = timed(decode_json)
+    binary_time, records = timed(decode_binary)
+    assert len(frames) == N and len(records) == 2 * N
+    assert np.allclose(records['values'][N:, :3], acc, atol=1e-6)
+
+    print(f"{'NDJSON':<8} {len(ndjson) / N:7.1f} bytes/sample {json_time / N * 1e6:8.3f} us/sample")
+    print(f"{'binary':<8} {len(binary) / N:7.1f} bytes/sample {binary_time / N * 1e6:8.3f} us/sample")
+    print(f"binary is {len(ndjson) / len(binary):.1f}x smaller and decodes {json_time / binary_time:.0f}x faster")
+
+
+if __name__ == '__main__':
+    main()
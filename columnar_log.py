@@ -0,0 +1,123 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'IMUCOL'
+VERSION = 1
+# magic, version, header size, payload size of the json column description
+HEADER_STRUCT = struct.Struct('<6sHII')
+HEADER_ALIGN = 64
+
+GRAPHICS_COLUMNS = (('x', '<f8'), ('y', '<f8'), ('z', '<f8'), ('timestamp', '<f8'))
+
+
+def make_dtype(columns):
+    return np.dtype([(name, dtype) for name, dtype in columns])
+
+
+def encode_header(dtype):
+    description = json.dumps([[name, dtype.fields[name][0].str] for name in dtype.names]).encode('utf-8')
+    size = HEADER_STRUCT.size + len(description)
+    size += -size % HEADER_ALIGN
+    header = HEADER_STRUCT.pack(MAGIC, VERSION, size, len(description)) + description
+    return header.ljust(size, b'\0')
+
+
+def read_header(f):
+    magic, version, size, description_size = HEADER_STRUCT.unpack(f.read(HEADER_STRUCT.size))
+    if magic != MAGIC:
+        raise ValueError(f"{getattr(f, 'name', f)} is not a columnar recording")
+    if version != VERSION:
+        raise ValueError(f"Unsupported columnar recording version {version}")
+    columns = json.loads(f.read(description_size).decode('utf-8'))
+    return make_dtype(columns), size
+
+
+class ColumnarWriter:
+    """
+    Append only binary recording, a small header followed by fixed size records.
+    Every column has a fixed dtype so readers can np.memmap the file directly.
+    """
+
+    def __init__(self, path, columns=GRAPHICS_COLUMNS):
+        self.path = path
+        self.dtype = make_dtype(columns)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                dtype, self.header_size = read_header(f)
+            if dtype != self.dtype:
+                raise ValueError(f"{path} was recorded with columns {dtype.names}")
+            self.file = open(path, 'ab')
+            # Drop a partially written record left by an interrupted session
+            rows = (os.path.getsize(path) - self.header_size) // self.dtype.itemsize
+            self.file.truncate(self.header_size + rows * self.dtype.itemsize)
+        else:
+            self.file = open(path, 'wb')
+            header = encode_header(self.dtype)
+            self.header_size = len(header)
+            self.file.write(header)
+            self.file.flush()
+
+    def write(self, rows):
+        # rows is an (n, columns) float array or a structured array of the recording dtype
+        rows = np.asarray(rows)
+        if rows.dtype != self.dtype:
+            records = np.empty(len(rows), dtype=self.dtype)
+            for i, name in enumerate(self.dtype.names):
+                records[name] = rows[:, i]
+            rows = records
+        self.file.write(rows.tobytes())
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnarTailReader:
+    """
+    Incremental reader of a recording that is still being written.
+    read_new maps only the rows appended since the previous call.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dtype = None
+        self.header_size = 0
+        self.offset = 0
+
+    def __open(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER_STRUCT.size:
+            return False
+        with open(self.path, 'rb') as f:
+            self.dtype, self.header_size = read_header(f)
+        return True
+
+    def available(self):
+        if self.dtype is None and not self.__open():
+            return 0
+        return max(0, (os.path.getsize(self.path) - self.header_size) // self.dtype.itemsize)
+
+    def __map(self, start, stop):
+        return np.memmap(self.path, dtype=self.dtype, mode='r',
+                         offset=self.header_size + start * self.dtype.itemsize, shape=(stop - start,))
+
+    def read_new(self):
+        rows = self.available()
+        if rows < self.offset:
+            # The recording was restarted, read it again from the beginning
+            self.offset = 0
+        if rows <= self.offset:
+            return None
+        new = self.__map(self.offset, rows)
+        self.offset = rows
+        return new
+
+    def tail(self, count):
+        rows = self.available()
+        if rows == 0:
+            return None
+        return self.__map(max(0, rows - count), rows)
@@ -0,0 +1,164 @@
+import numpy as np
+
+
+def _as_float(x):
+    # Time axes are datetime64, the triangle areas are computed on their integer ticks
+    x = np.asarray(x)
+    if x.dtype.kind == 'M':
+        return x.view('int64').astype(float)
+    return x.astype(float, copy=False)
+
+
+def minmax_buckets(y, bucket_size):
+    """
+    Indices of the min and max sample of every complete bucket of y, in time order, shape (n_buckets, 2).
+    """
+    n_buckets = len(y) // bucket_size
+    blocks = np.asarray(y[:n_buckets * bucket_size]).reshape(n_buckets, bucket_size)
+    offsets = np.arange(n_buckets) * bucket_size
+    lo = blocks.argmin(axis=1) + offsets
+    hi = blocks.argmax(axis=1) + offsets
+    return np.sort(np.column_stack((lo, hi)), axis=1)
+
+
+def lttb_bucket(x, y, start, stop, anchor_x, anchor_y, next_x, next_y):
+    # Largest triangle between the previous selected point, this bucket and the next bucket average
+    area = np.abs((anchor_x - next_x) * (y[start:stop] - anchor_y) - (anchor_x - x[start:stop]) * (next_y - anchor_y))
+    return start + int(area.argmax())
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling of (x, y) to n_out points, returns the selected indices.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    xf, yf = _as_float(x), np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    # Averages of every bucket in one pass, used as the third triangle point
+    sums_x = np.add.reduceat(xf[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(yf[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    mean_x, mean_y = sums_x / counts, sums_y / counts
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    for i in range(n_out - 2):
+        a = selected[i]
+        if i + 1 < n_out - 2:
+            next_x, next_y = mean_x[i + 1], mean_y[i + 1]
+        else:
+            next_x, next_y = xf[-1], yf[-1]
+        selected[i + 1] = lttb_bucket(xf, yf, edges[i], edges[i + 1], xf[a], yf[a], next_x, next_y)
+    return selected
+
+
+class Decimator:
+    """
+    Level of detail reduction of a ring buffer trace to about n_out points.
+    Buckets are aligned on the global sample count of the buffer, so buckets that
+    are final (complete, and for LTTB followed by a complete bucket) are cached
+    and every tick only the newest bucket is computed.
+    The bucket size follows the window length (powers of two up to the size of a full buffer),
+    a window of at most n_out points is not reduced at all. A new size starts a new cache.
+    mode is 'minmax' (min and max sample of each bucket) or 'lttb'.
+    """
+
+    def __init__(self, capacity, n_out, mode='minmax'):
+        if mode not in ('minmax', 'lttb'):
+            raise ValueError(f"Unknown decimation mode {mode}")
+        self.mode = mode
+        self.n_out = n_out
+        self.per_bucket = 2 if mode == 'minmax' else 1
+        self.max_bucket_size = max(1, -(-capacity * self.per_bucket // n_out))
+        self.bucket_size = 1
+        # Global indices of the selected samples, bucket b is stored in slot b % n_slots
+        self.n_slots = max(capacity // self.max_bucket_size, n_out) + 2
+        self.selected = np.zeros((self.n_slots, self.per_bucket), dtype=np.int64)
+        self.cache_start = 0  # Cached buckets are cache_start <= b < cache_stop
+        self.cache_stop = 0
+        self.end = 0
+
+    @property
+    def final_until(self):
+        # Buckets below this number are final
+        return self.cache_stop
+
+    @property
+    def final_sample(self):
+        # Samples below this global number are in final buckets, unlike bucket numbers it keeps its meaning
+        # when the bucket size changes
+        return self.cache_stop * self.bucket_size
+
+    def size_for(self, length):
+        # Smallest power of two bucket that keeps length samples within n_out points
+        if length <= self.n_out:
+            return 1
+        needed = -(-length * self.per_bucket // self.n_out)
+        return min(1 << (needed - 1).bit_length(), self.max_bucket_size)
+
+    def select(self, x, y, first):
+        """
+        x, y: the window, first: global sample number of y[0].
+        Returns the window indices of the selected samples and the bucket number of each of them.
+        """
+        size = self.size_for(len(y))
+        resized = size != self.bucket_size
+        self.bucket_size = size
+        end = first + len(y)
+        first_bucket = -(-first // size)  # The leading partial bucket is skipped
+        complete_until = end // size
+        # A single sample bucket has nothing to wait for
+        final_until = complete_until if self.mode == 'minmax' or size == 1 else max(first_bucket, complete_until - 1)
+
+        if resized or end < self.end or first_bucket < self.cache_start or first_bucket > self.cache_stop:
+            # New bucket size, restarted buffer or a gap since the last call, nothing cached can be reused
+            self.cache_start = self.cache_stop = first_bucket
+        self.end = end
+        self.cache_start = first_bucket
+        if final_until > self.cache_stop:
+            if self.mode == 'minmax' or size == 1:
+                self.__fill_minmax(y, first, self.cache_stop, final_until)
+            else:
+                self.__fill_lttb(x, y, first, self.cache_stop, final_until)
+            self.cache_stop = final_until
+
+        buckets = np.arange(first_bucket, final_until)
+        # Undecimated windows have one sample per bucket, its min and max are the same point
+        per_bucket = 1 if size == 1 else self.per_bucket
+        indices = self.selected[buckets % self.n_slots, :per_bucket].ravel() - first
+        return indices, np.repeat(buckets, per_bucket)
+
+    def decimate(self, x, y, first):
+        indices, _ = self.select(x, y, first)
+        return np.asarray(x)[indices], np.asarray(y)[indices]
+
+    def __fill_minmax(self, y, first, start_bucket, stop_bucket):
+        size = self.bucket_size
+        offset = start_bucket * size - first
+        pairs = minmax_buckets(y[offset:offset + (stop_bucket - start_bucket) * size], size) + start_bucket * size
+        self.selected[np.arange(start_bucket, stop_bucket) % self.n_slots] = pairs[:, :self.per_bucket]
+
+    def __fill_lttb(self, x, y, first, start_bucket, stop_bucket):
+        size = self.bucket_size
+        # Only the part of the window around the missing buckets is converted
+        lo = max(0, start_bucket * size - first - size)
+        hi = min(len(y), stop_bucket * size - first + size)
+        xf, yf = _as_float(x[lo:hi]), np.asarray(y[lo:hi], dtype=float)
+        first += lo
+        for bucket in range(start_bucket, stop_bucket):
+            start = bucket * size - first
+            stop = start + size
+            if bucket - 1 >= self.cache_start:
+                # Previous bucket is cached or was selected just before in this loop
+                a = self.selected[(bucket - 1) % self.n_slots, 0] - first
+                anchor_x, anchor_y = xf[a], yf[a]
+            elif start >= size:
+                # Previous bucket is in the window but was never selected, use its average
+                anchor_x, anchor_y = xf[start - size:start].mean(), yf[start - size:start].mean()
+            else:
+                anchor_x, anchor_y = xf[0], yf[0]
+            next_x, next_y = xf[stop:stop + size].mean(), yf[stop:stop + size].mean()
+            index = lttb_bucket(xf, yf, start, stop, anchor_x, anchor_y, next_x, next_y)
+            self.selected[bucket % self.n_slots, 0] = index + first
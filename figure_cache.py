@@ -0,0 +1,47 @@
+import threading
+from collections import OrderedDict
+
+
+class GenerationCache:
+    """
+    Bounded LRU cache of built results, keyed by the data generation and the view parameters.
+    Concurrent requests for a key that is being built wait for that build instead of repeating it.
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.building = dict()  # key -> lock held while the key is built
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            key_lock = self.building.setdefault(key, threading.Lock())
+        with key_lock:
+            with self.lock:
+                if key in self.entries:
+                    # Built by another request while this one waited
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return self.entries[key]
+            value = build()
+            with self.lock:
+                self.misses += 1
+                self.entries[key] = value
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+                self.building.pop(key, None)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
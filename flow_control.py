@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import deque
+
+import metrics
+
+POLICIES = ('block', 'drop_oldest', 'decimate', 'priority')
+
+
+class BoundedBuffer:
+    """
+    Bounded FIFO between an ingest thread and a processing thread with a selectable overload policy:
+    'block': put() waits for free space (the producer slows down, nothing is lost)
+    'drop_oldest': a full buffer drops its oldest item to make room
+    'decimate': above half full, samples of a sensor closer than 1 / rate_hz seconds to the last
+        accepted one are dropped, when still full the oldest item goes
+    'priority': a full buffer drops the oldest item of the lowest priority sensor,
+        priorities maps sensor -> int (higher is kept longer, unknown sensors are 0)
+    Everything that is dropped is counted in the metrics registry as imu_<name>_shed_total.
+    """
+
+    def __init__(self, maxsize, policy='block', rate_hz=None, priorities=None, name='ingest'):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overload policy {policy}, expected one of {POLICIES}")
+        if policy == 'decimate' and not rate_hz:
+            raise ValueError("The decimate policy needs rate_hz")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.min_interval = 1.0 / rate_hz if rate_hz else 0.0
+        self.priorities = priorities or dict()
+        # One FIFO per priority level, items carry a sequence number to keep the overall order
+        self.queues = dict()
+        self.size = 0
+        self.sequence = 0
+        self.last_accepted = dict()  # sensor -> timestamp, for decimate
+        self.closed = False
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.shed = metrics.counter(f'imu_{name}_shed_total', f"Items dropped by the {name} buffer under overload")
+        self.blocked = metrics.counter(f'imu_{name}_blocked_total', f"Puts that waited for space in the {name} buffer")
+        self.shed_by_reason = {'oldest': 0, 'decimated': 0, 'priority': 0}
+
+    def __len__(self):
+        return self.size
+
+    def put(self, item, sensor=None, timestamp=None, priority=None):
+        """
+        Adds an item, returns False if the policy dropped it.
+        timestamp (seconds) is used by decimate, the arrival time when not given.
+        priority overrides the priorities lookup of the sensor.
+        """
+        with self.lock:
+            if self.closed:
+                return False
+            if self.policy != 'priority':
+                priority = 0
+            elif priority is None:
+                priority = self.priorities.get(sensor, 0)
+            if self.size >= self.maxsize:
+                if self.policy == 'block':
+                    self.blocked.inc()
+                    while self.size >= self.maxsize and not self.closed:
+                        self.not_full.wait()
+                    if self.closed:
+                        return False
+                elif self.policy == 'priority':
+                    lowest = min(p for p, q in self.queues.items() if q)
+                    if lowest > priority:
+                        self.__drop('priority')
+                        return False
+                    self.queues[lowest].popleft()
+                    self.__dropped_queued('priority')
+                elif self.policy == 'decimate' and not self.__rate_ok(sensor, timestamp):
+                    self.__drop('decimated')
+                    return False
+                else:
+                    self.__pop_oldest()
+                    self.__dropped_queued('oldest')
+            elif self.policy == 'decimate' and self.size >= self.maxsize // 2 and not self.__rate_ok(sensor, timestamp):
+                self.__drop('decimated')
+                return False
+            if self.policy == 'decimate':
+                self.last_accepted[sensor] = time.monotonic() if timestamp is None else timestamp
+
+            queue = self.queues.get(priority)
+            if queue is None:
+                queue = self.queues[priority] = deque()
+            queue.append((self.sequence, item))
+            self.sequence += 1
+            self.size += 1
+            self.not_empty.notify()
+            return True
+
+    def __rate_ok(self, sensor, timestamp):
+        t = time.monotonic() if timestamp is None else timestamp
+        last = self.last_accepted.get(sensor)
+        return last is None or t - last >= self.min_interval
+
+    def __drop(self, reason):
+        self.shed_by_reason[reason] += 1
+        self.shed.inc()
+
+    def __dropped_queued(self, reason):
+        self.size -= 1
+        self.__drop(reason)
+
+    def __pop_oldest(self):
+        queue = min((q for q in self.queues.values() if q), key=lambda q: q[0][0])
+        return queue.popleft()[1]
+
+    def get_batch(self, max_items=256, timeout=None):
+        """
+        Waits for at least one item and returns up to max_items in arrival order.
+        Returns [] on timeout and None once the buffer is closed and empty.
+        """
+        with self.lock:
+            if not self.size and not self.closed:
+                self.not_empty.wait(timeout)
+            if not self.size:
+                return None if self.closed else []
+            if len(self.queues) == 1:
+                queue = next(iter(self.queues.values()))
+                batch = [queue.popleft()[1] for _ in range(min(max_items, self.size))]
+            else:
+                batch = [self.__pop_oldest() for _ in range(min(max_items, self.size))]
+            self.size -= len(batch)
+            self.not_full.notify_all()
+            return batch
+
+    def close(self):
+        # Producers stop, the consumer still drains what is buffered
+        with self.lock:
+            self.closed = True
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+
+    def get_stats(self):
+        return {'policy': self.policy, 'depth': self.size, 'shed': self.shed_by_reason.copy(),
+                'blocked': self.blocked.value}
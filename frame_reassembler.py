@@ -0,0 +1,104 @@
+import json
+
+import numpy as np
+
+from metrics import BYTES_RECEIVED, DECODE_FAILURES, FRAMES_PARSED
+from wire_protocol import RECORD_DTYPE, STREAM_MAGIC, decode_records
+
+
+class FrameReassembler:
+    """
+    Reassemble newline delimited frames from a byte stream.
+    Partial lines are kept in the buffer until the rest of the line arrives,
+    so frames that straddle a recv boundary are not lost.
+    Streams that start with wire_protocol.STREAM_MAGIC are binary records instead, read with records().
+    """
+
+    def __init__(self, read_size=64 * 1024, delimiter=b'\n'):
+        self.delimiter = delimiter
+        self.buffer = bytearray()
+        self.read_buffer = bytearray(read_size)
+        self.read_view = memoryview(self.read_buffer)
+        self.byte_count = 0
+        self.frame_count = 0
+        self.malformed_count = 0
+        self.binary = None  # Detected from the first bytes of the stream
+
+    def recv_from(self, sock):
+        # Read straight into the preallocated buffer, returns 0 when the peer closed
+        n = sock.recv_into(self.read_buffer)
+        if n:
+            self.feed(self.read_view[:n])
+        return n
+
+    def last_read(self, n):
+        return self.read_view[:n].tobytes()
+
+    def feed(self, data):
+        self.byte_count += len(data)
+        BYTES_RECEIVED.inc(len(data))
+        self.buffer += data
+        if self.binary is None:
+            self.__detect()
+
+    def __detect(self):
+        prefix = bytes(self.buffer[:len(STREAM_MAGIC)])
+        if prefix == STREAM_MAGIC:
+            self.binary = True
+            del self.buffer[:len(STREAM_MAGIC)]
+        elif not STREAM_MAGIC.startswith(prefix):
+            self.binary = False
+
+    def frames(self):
+        # Only complete lines are yielded, the partial tail stays for the next read
+        if self.binary is not False:
+            return
+        end = self.buffer.rfind(self.delimiter)
+        if end < 0:
+            return
+        chunk = bytes(self.buffer[:end])
+        del self.buffer[:end + len(self.delimiter)]
+        lines = [line for line in chunk.split(self.delimiter) if line.strip()]
+        self.frame_count += len(lines)
+        FRAMES_PARSED.inc(len(lines))
+        yield from lines
+
+    def records(self):
+        # Binary streams: every complete record in the buffer as one structured array
+        if not self.binary:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        records, consumed = decode_records(self.buffer)
+        del self.buffer[:consumed]
+        self.frame_count += len(records)
+        FRAMES_PARSED.inc(len(records))
+        return records
+
+    def json_frames(self):
+        for line in self.frames():
+            json_data = self.decode(line)
+            if json_data is not None:
+                yield json_data
+
+    def decode(self, line):
+        # JSON object of a frame, None (counted as malformed) for anything else
+        try:
+            json_data = json.loads(line)
+        except ValueError:
+            # json.JSONDecodeError and UnicodeDecodeError are both ValueErrors
+            json_data = None
+        if not isinstance(json_data, dict):
+            self.malformed_count += 1
+            DECODE_FAILURES.inc()
+            return None
+        return json_data
+
+    def pending(self):
+        return len(self.buffer)
+
+    def get_stats(self):
+        return {
+            'bytes': self.byte_count,
+            'frames': self.frame_count,
+            'malformed': self.malformed_count,
+            'pending': self.pending(),
+        }
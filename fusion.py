@@ -0,0 +1,153 @@
+import numpy as np
+
+from gyro import quat_multiply
+from orientation import rotvec_to_quaternion
+
+
+def rotate_to_body(q, v):
+    """
+    Rotates world frame vectors v (n, 3) into the body frames of the (n, 4) quaternions q (x, y, z, w).
+    """
+    u, w = q[:, :3], q[:, 3:]
+    # v' = v + 2 * u x (u x v - w * v), the conjugate rotation of q
+    t = np.cross(u, v) - w * v
+    return v + 2.0 * np.cross(u, t)
+
+
+class FusionBank:
+    """
+    Gyroscope and accelerometer fusion for many devices at once.
+    The state of every device lives in struct-of-arrays NumPy buffers indexed by a slot number,
+    so one vectorized step updates all devices that have a new sample.
+    method is 'madgwick' (gradient descent, gain beta) or 'complementary'
+    (gyro integration with a proportional tilt correction towards gravity, gain kp).
+    """
+
+    def __init__(self, capacity=16, method='madgwick', beta=0.1, kp=1.0, time_scale=1e-9, max_dt=1.0):
+        if method not in ('madgwick', 'complementary'):
+            raise ValueError(f"Unknown fusion method {method}")
+        self.method = method
+        self.beta = beta
+        self.kp = kp
+        self.time_scale = time_scale  # Multiplier from timestamp units to seconds (1e-9 for ns)
+        self.max_dt = max_dt
+        self.slots = dict()  # device key -> slot
+        self.free = []
+        self.quaternion = np.zeros((0, 4))
+        self.last_time = np.zeros(0)
+        self.initialized = np.zeros(0, dtype=bool)
+        self.__grow(capacity)
+
+    def __grow(self, capacity):
+        old = len(self.quaternion)
+        quaternion = np.zeros((capacity, 4))
+        quaternion[:, 3] = 1.0
+        quaternion[:old] = self.quaternion
+        self.quaternion = quaternion
+        self.last_time = np.concatenate((self.last_time, np.zeros(capacity - old)))
+        self.initialized = np.concatenate((self.initialized, np.zeros(capacity - old, dtype=bool)))
+        self.free.extend(range(capacity - 1, old - 1, -1))
+
+    def slot(self, key):
+        # Slot of a device, new devices get a free slot (the buffers double when full)
+        slot = self.slots.get(key)
+        if slot is None:
+            if not self.free:
+                self.__grow(2 * len(self.quaternion))
+            slot = self.free.pop()
+            self.slots[key] = slot
+        return slot
+
+    def remove(self, key):
+        slot = self.slots.pop(key, None)
+        if slot is not None:
+            self.quaternion[slot] = (0.0, 0.0, 0.0, 1.0)
+            self.initialized[slot] = False
+            self.free.append(slot)
+
+    def get_quaternion(self, key):
+        slot = self.slots.get(key)
+        return None if slot is None else tuple(self.quaternion[slot])
+
+    def step(self, slots, timestamps, gyro, acc):
+        """
+        One fusion step for the devices in slots (unique), with one gyro (rad/s) and accelerometer sample each.
+        Returns the updated (n, 4) quaternions.
+        """
+        slots = np.asarray(slots, dtype=int)
+        t = np.asarray(timestamps, dtype=float) * self.time_scale
+        gyro = np.asarray(gyro, dtype=float).reshape(-1, 3)
+        acc = np.asarray(acc, dtype=float).reshape(-1, 3)
+
+        dt = np.where(self.initialized[slots], t - self.last_time[slots], 0.0)
+        dt[(dt < 0) | (dt > self.max_dt)] = 0.0
+        self.last_time[slots] = t
+        self.initialized[slots] = True
+
+        q = self.quaternion[slots]
+        norm = np.linalg.norm(acc, axis=1)
+        valid = norm > 0
+        acc_n = np.divide(acc, norm[:, None], out=np.zeros_like(acc), where=valid[:, None])
+        if self.method == 'madgwick':
+            q = self.__madgwick(q, gyro, acc_n, valid, dt)
+        else:
+            q = self.__complementary(q, gyro, acc_n, valid, dt)
+        q /= np.linalg.norm(q, axis=1)[:, None]
+        self.quaternion[slots] = q
+        return q
+
+    def update(self, keys, timestamps, gyro, acc):
+        """
+        Fuses a batch of samples that may hold several samples per device.
+        Samples of one device are applied in order, every round steps all devices that still have samples.
+        Returns the (n, 4) quaternion after every sample, in the order of the samples.
+        """
+        slots = np.array([self.slot(key) for key in keys], dtype=int)
+        timestamps = np.asarray(timestamps, dtype=float)
+        gyro = np.asarray(gyro, dtype=float).reshape(-1, 3)
+        acc = np.asarray(acc, dtype=float).reshape(-1, 3)
+        # Occurrence number of every sample within its device
+        order = np.argsort(slots, kind='stable')
+        sorted_slots = slots[order]
+        starts = np.flatnonzero(np.r_[True, sorted_slots[1:] != sorted_slots[:-1]])
+        rank = np.empty(len(slots), dtype=int)
+        rank[order] = np.arange(len(slots)) - np.repeat(starts, np.diff(np.r_[starts, len(slots)]))
+        fused = np.empty((len(slots), 4))
+        for r in range(rank.max() + 1 if len(rank) else 0):
+            index = np.flatnonzero(rank == r)
+            fused[index] = self.step(slots[index], timestamps[index], gyro[index], acc[index])
+        return fused
+
+    def __complementary(self, q, gyro, acc_n, valid, dt):
+        # Gravity direction predicted by the current orientation vs the measured one,
+        # their cross product is fed back into the rates (Mahony style proportional correction)
+        predicted = rotate_to_body(q, np.tile((0.0, 0.0, 1.0), (len(q), 1)))
+        error = np.cross(acc_n, predicted)
+        rates = gyro + self.kp * error * valid[:, None]
+        return quat_multiply(q, rotvec_to_quaternion(rates * dt[:, None]))
+
+    def __madgwick(self, q, gyro, acc_n, valid, dt):
+        q1, q2, q3, q0 = q[:, 0], q[:, 1], q[:, 2], q[:, 3]  # q0 is the scalar part
+        gx, gy, gz = gyro[:, 0], gyro[:, 1], gyro[:, 2]
+        ax, ay, az = acc_n[:, 0], acc_n[:, 1], acc_n[:, 2]
+
+        # Rate of change of the quaternion from the gyroscope
+        dq0 = 0.5 * (-q1 * gx - q2 * gy - q3 * gz)
+        dq1 = 0.5 * (q0 * gx + q2 * gz - q3 * gy)
+        dq2 = 0.5 * (q0 * gy - q1 * gz + q3 * gx)
+        dq3 = 0.5 * (q0 * gz + q1 * gy - q2 * gx)
+
+        # Gradient descent step towards the measured gravity direction
+        s0 = 4 * q0 * q2 * q2 + 2 * q2 * ax + 4 * q0 * q1 * q1 - 2 * q1 * ay
+        s1 = (4 * q1 * q3 * q3 - 2 * q3 * ax + 4 * q0 * q0 * q1 - 2 * q0 * ay - 4 * q1
+              + 8 * q1 * q1 * q1 + 8 * q1 * q2 * q2 + 4 * q1 * az)
+        s2 = (4 * q0 * q0 * q2 + 2 * q0 * ax + 4 * q2 * q3 * q3 - 2 * q3 * ay - 4 * q2
+              + 8 * q2 * q1 * q1 + 8 * q2 * q2 * q2 + 4 * q2 * az)
+        s3 = 4 * q1 * q1 * q3 - 2 * q1 * ax + 4 * q2 * q2 * q3 - 2 * q2 * ay
+        s = np.stack((s1, s2, s3, s0), axis=1)
+        s_norm = np.linalg.norm(s, axis=1)
+        use = valid & (s_norm > 0)
+        s = np.divide(s, s_norm[:, None], out=np.zeros_like(s), where=use[:, None])
+
+        dq = np.stack((dq1, dq2, dq3, dq0), axis=1) - self.beta * s
+        return q + dq * dt[:, None]
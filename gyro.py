@@ -0,0 +1,123 @@
+import math
+
+import numpy as np
+
+from metrics import INTEGRATION_SECONDS
+from orientation import quaternion_to_euler_scalar, rotvec_to_quaternion
+
+
+def quat_multiply(a, b):
+    """
+    Hamilton product of (n, 4) quaternion arrays in (x, y, z, w) order.
+    """
+    ax, ay, az, aw = a[..., 0], a[..., 1], a[..., 2], a[..., 3]
+    bx, by, bz, bw = b[..., 0], b[..., 1], b[..., 2], b[..., 3]
+    return np.stack((
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+        aw * bw - ax * bx - ay * by - az * bz,
+    ), axis=-1)
+
+
+def cumulative_quat_product(q):
+    """
+    Running products q[0] * q[1] * ... * q[i] for every i, in log2(n) vectorized passes.
+    """
+    out = q.copy()
+    shift = 1
+    while shift < len(out):
+        out[shift:] = quat_multiply(out[:-shift], out[shift:])
+        shift *= 2
+    return out
+
+
+class GyroIntegrator:
+    """
+    Integrates body frame angular rates into an orientation quaternion using the real sample timestamps.
+    Each interval rotates by exp(mean rate * dt / 2), whole arrays of samples are integrated in one call
+    and the orientation, last timestamp and last rate carry over to the next call.
+    """
+
+    def __init__(self, time_scale=1e-9, max_dt=1.0):
+        self.time_scale = time_scale  # Multiplier from timestamp units to seconds (1e-9 for ns)
+        self.max_dt = max_dt  # Longer gaps (dropped connection) are not integrated
+        self.quaternion = np.array([0.0, 0.0, 0.0, 1.0])
+        self.last_time = None
+        self.last_rate = None
+
+    def process(self, timestamps, rates):
+        """
+        timestamps: (n,) array, rates: (n, 3) array in rad/s.
+        Returns the (n, 4) orientation quaternions after every sample.
+        """
+        t = np.asarray(timestamps, dtype=float) * self.time_scale
+        rates = np.asarray(rates, dtype=float).reshape(-1, 3)
+        if len(t) == 0:
+            return np.empty((0, 4))
+
+        previous_time = t[0] if self.last_time is None else self.last_time
+        previous_rate = rates[0] if self.last_rate is None else self.last_rate
+        dt = np.diff(t, prepend=previous_time)
+        dt[(dt < 0) | (dt > self.max_dt)] = 0.0
+        mean_rate = 0.5 * (rates + np.vstack((previous_rate, rates[:-1])))
+
+        q = cumulative_quat_product(rotvec_to_quaternion(mean_rate * dt[:, None]))
+        q = quat_multiply(self.quaternion[None, :], q)
+        q /= np.linalg.norm(q, axis=1)[:, None]
+
+        self.quaternion = q[-1].copy()
+        self.last_time = t[-1]
+        self.last_rate = rates[-1].copy()
+        return q
+
+    def reset(self):
+        self.quaternion = np.array([0.0, 0.0, 0.0, 1.0])
+        self.last_time = None
+        self.last_rate = None
+
+
+class GyroscopeOrientation:
+    """
+    Per sample wrapper around GyroIntegrator.
+    Samples without a timestamp (ns) are assumed to be dt seconds apart.
+    """
+
+    def __init__(self, dt=0.01):
+        self.dt = dt
+        self.integrator = GyroIntegrator(time_scale=1e-9)
+        self.time_stamp = 0
+
+    def update_orientation(self, gyro_x, gyro_y, gyro_z, time_stamp=None):
+        if time_stamp is None:
+            time_stamp = self.time_stamp + self.dt * 1e9
+        self.time_stamp = time_stamp
+        with INTEGRATION_SECONDS.time():
+            self.integrator.process((time_stamp,), ((gyro_x, gyro_y, gyro_z),))
+
+    def update_block(self, time_stamps, rates):
+        time_stamps = np.asarray(time_stamps, dtype=float)
+        missing = np.isnan(time_stamps)
+        if missing.any():
+            # NaN timestamps follow the previous sample by dt, like update_orientation without one
+            time_stamps = time_stamps.copy()
+            last = self.time_stamp
+            for i in range(len(time_stamps)):
+                if missing[i]:
+                    time_stamps[i] = last + self.dt * 1e9
+                last = time_stamps[i]
+        if len(time_stamps):
+            self.time_stamp = time_stamps[-1]
+        with INTEGRATION_SECONDS.time():
+            return self.integrator.process(time_stamps, rates)
+
+    def get_quaternion(self):
+        return tuple(self.integrator.quaternion)
+
+    def get_gyro(self):
+        # Euler angles in radians, kept within 0 to 2*pi like the old per axis accumulation
+        x, y, z, w = self.integrator.quaternion
+        return tuple(angle % (2 * math.pi) for angle in quaternion_to_euler_scalar(x, y, z, w))
+
+    def get_g(self):
+        return self.get_gyro()
@@ -0,0 +1,123 @@
+import time
+
+START = time.perf_counter()  # Before the other imports, they are part of the reported startup time
+
+import argparse
+import asyncio
+import signal
+import sys
+
+from async_tcp_server import AsyncTCPServer
+from metrics import StatsReporter, install_profile_signal
+from recorder import OUTPUT_DIR, get_recorder
+from TCP_server import MotionLog
+
+IMPORT_SECONDS = time.perf_counter() - START
+
+# Never needed to ingest, a startup that loaded one of them has a regression in its imports
+HEAVY_MODULES = ('scipy', 'matplotlib', 'dash', 'plotly', 'flask', 'pandas')
+STATS_INTERVAL = 5  # Seconds between metrics lines, 0 disables them
+
+
+class SessionLog:
+    """
+    Records every device in its own TCP_server logs (orientation_<device>.txt, ...). The device is named
+    after the deviceId of its frames or else its host, so a reconnect (new ephemeral port) appends to the
+    same files. A second device connected at the same time under the same name gets a _2, _3, ... suffix.
+    The files of a device are closed when it disconnects.
+    With live set the samples of one device at a time, the first connected, also go to the
+    shared memory ring of this port for the visualizers.
+    """
+
+    def __init__(self, recorder, port, live=False):
+        self.recorder = recorder
+        self.names = dict()  # peer address -> device name
+        self.logs = dict()  # device name -> MotionLog
+        self.live = None
+        self.live_device = None
+        if live:
+            # Shared memory is only set up when something will read it
+            from shm_ring import SharedRingWriter, ring_name
+            self.live = SharedRingWriter(ring_name(port))
+            print("Live ring", ring_name(port))
+
+    def device_name(self, session):
+        frame = session.last_frame
+        device = frame.get('deviceId') if isinstance(frame, dict) else None
+        base = str(device if device else session.addr[0])
+        base = ''.join(c if c.isalnum() or c in '-_' else '-' for c in base)
+        name, n = base, 1
+        while name in self.logs:
+            n += 1
+            name = f"{base}_{n}"
+        return name
+
+    def log(self, session):
+        name = self.names.get(session.addr)
+        if name is None:
+            name = self.names[session.addr] = self.device_name(session)
+            self.logs[name] = MotionLog(self.recorder, f"_{name}")
+        return self.logs[name]
+
+    def __call__(self, session):
+        log = self.log(session)
+        if self.live is not None and self.live_device is None:
+            self.live_device = session.addr
+        log.live = self.live if session.addr == self.live_device else None
+        log.persist(session.rot_vec.get_orientation(), session.linear_acc.get_position(), session.linear_acc.get_data())
+
+    def disconnected(self, session):
+        if session.addr == self.live_device:
+            # The next device that sends data takes over the ring
+            self.live_device = None
+        name = self.names.pop(session.addr, None)
+        if name is not None:
+            self.logs.pop(name).close()
+
+    def close(self):
+        if self.live is not None:
+            self.live.close()
+
+
+def startup_report(ready_seconds):
+    heavy = sorted(name for name in HEAVY_MODULES if name in sys.modules)
+    line = f"Ready in {ready_seconds * 1e3:.0f} ms (imports {IMPORT_SECONDS * 1e3:.0f} ms)"
+    if heavy:
+        line += f", heavy modules loaded: {', '.join(heavy)}"
+    return line
+
+
+async def serve(server):
+    await server.start()
+    print(startup_report(time.perf_counter() - START), flush=True)
+    await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless sensor ingest, records the devices without any plotting")
+    parser.add_argument('--host', help="defaults to the host name, like TCP_server")
+    parser.add_argument('--port', type=int, default=9885, help="one port per process when running one per device")
+    parser.add_argument('--live', action='store_true',
+                        help="also feed the shared memory ring of test_plot.py (shm_ring.ring_name(port))")
+    args = parser.parse_args()
+
+    log = SessionLog(get_recorder(), args.port, live=args.live)
+    server = AsyncTCPServer(args.host, args.port, on_update=log, on_disconnect=log.disconnected)
+    if STATS_INTERVAL:
+        StatsReporter(STATS_INTERVAL).start()
+    install_profile_signal(OUTPUT_DIR)
+    # A supervisor stops the process with SIGTERM, it gets the same clean shutdown as Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        asyncio.run(serve(server))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            get_recorder().flush()
+        finally:
+            log.close()
+
+
+if __name__ == '__main__':
+    main()
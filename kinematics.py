@@ -0,0 +1,67 @@
+import numpy as np
+
+
+def cumulative_trapezoid(values, dt, initial):
+    """
+    Cumulative trapezoid integral of values (n + 1, 3) over the n intervals dt,
+    starting from initial. Returns the integral at the last n samples.
+    """
+    return initial + np.cumsum(0.5 * (values[1:] + values[:-1]) * dt[:, None], axis=0)
+
+
+class BlockIntegrator:
+    """
+    Integrates blocks of (timestamp, ax, ay, az) samples into velocity and position.
+    The last sample of each block is kept, so feeding a stream block by block
+    gives the same result as integrating the whole recording at once.
+    """
+
+    def __init__(self, time_scale=1.0, initial_position=(0, 0, 0), initial_velocity=(0, 0, 0)):
+        self.time_scale = time_scale  # Multiplier from timestamp units to seconds (1e-9 for ns)
+        self.velocity = np.array(initial_velocity, dtype=float)
+        self.position = np.array(initial_position, dtype=float)
+        self.last_time = None
+        self.last_acc = np.zeros(3)
+
+    def process(self, timestamps, acc):
+        """
+        timestamps: (n,) array, acc: (n, 3) array.
+        Returns the velocity and position at every sample as (n, 3) arrays.
+        """
+        t = np.asarray(timestamps, dtype=float) * self.time_scale
+        acc = np.asarray(acc, dtype=float).reshape(-1, 3)
+        n = len(t)
+        if n == 0:
+            return np.empty((0, 3)), np.empty((0, 3))
+
+        velocity = np.empty((n, 3))
+        position = np.empty((n, 3))
+        if self.last_time is None:
+            # The first sample only sets the start of the integration
+            velocity[0] = self.velocity
+            position[0] = self.position
+            self.last_time = t[0]
+            self.last_acc = acc[0].copy()
+            t, acc, start = t[1:], acc[1:], 1
+            if n == 1:
+                return velocity, position
+        else:
+            start = 0
+
+        dt = np.abs(np.diff(t, prepend=self.last_time))
+        acc_ext = np.vstack((self.last_acc, acc))
+        velocity[start:] = cumulative_trapezoid(acc_ext, dt, self.velocity)
+        vel_ext = np.vstack((self.velocity, velocity[start:]))
+        position[start:] = cumulative_trapezoid(vel_ext, dt, self.position)
+
+        self.last_time = t[-1]
+        self.last_acc = acc[-1].copy()
+        self.velocity = velocity[-1].copy()
+        self.position = position[-1].copy()
+        return velocity, position
+
+    def reset(self):
+        self.velocity = np.zeros(3)
+        self.position = np.zeros(3)
+        self.last_time = None
+        self.last_acc = np.zeros(3)
@@ -0,0 +1,191 @@
+import time
+
+import numpy as np
+
+import metrics
+from decimation import Decimator
+from fusion import rotate_to_body
+
+FRAME_SECONDS = metrics.histogram('imu_plot_frame_seconds', "Time spent drawing a frame of the desktop live plot")
+
+# Phone axes drawn in the orientation view, x red, y green, z blue
+BODY_AXES = np.eye(3)
+BODY_COLORS = ('tab:red', 'tab:green', 'tab:blue')
+
+
+def body_axes(q):
+    # The phone x, y, z axes in the world frame for the (x, y, z, w) quaternion q
+    q = np.asarray(q, dtype=float).reshape(1, 4)
+    inverse = q * (-1.0, -1.0, -1.0, 1.0)
+    return rotate_to_body(np.repeat(inverse, 3, axis=0), BODY_AXES)
+
+
+class Blitter:
+    """
+    Redraws only the animated artists of a figure over a saved background.
+    The background is captured on every full draw, so a full draw (after the axes limits or the
+    window size changed) is the only thing that re-renders ticks, labels and grid.
+    """
+
+    def __init__(self, canvas, artists):
+        self.canvas = canvas
+        self.artists = list(artists)
+        self.background = None
+        for artist in self.artists:
+            artist.set_animated(True)
+        canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        figure = self.canvas.figure
+        for artist in self.artists:
+            figure.draw_artist(artist)
+
+    def redraw(self):
+        if self.background is None:
+            # draw() fires on_draw, which saves the background and draws the artists
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self.draw_artists()
+            self.canvas.blit(self.canvas.figure.bbox)
+        self.canvas.flush_events()
+
+    def full_redraw(self):
+        self.background = None
+        self.redraw()
+
+
+class FrameClock:
+    """
+    Achieved frame period (between frames) and draw time (inside frames) over the last report interval.
+    """
+
+    def __init__(self):
+        self.last = None
+        self.periods = []
+        self.draws = []
+
+    def frame(self, draw_seconds):
+        now = time.perf_counter()
+        if self.last is not None:
+            self.periods.append(now - self.last)
+        self.last = now
+        self.draws.append(draw_seconds)
+        FRAME_SECONDS.observe(draw_seconds)
+
+    def report(self):
+        # One line summary, then starts a new interval
+        if not self.periods:
+            return "no frames"
+        periods = np.array(self.periods)
+        draws = np.array(self.draws)
+        self.periods, self.draws = [], []
+        return (f"{1.0 / periods.mean():.0f} fps, frame {periods.mean() * 1e3:.1f} ms "
+                f"(p95 {np.percentile(periods, 95) * 1e3:.1f} ms), draw {draws.mean() * 1e3:.1f} ms "
+                f"(p95 {np.percentile(draws, 95) * 1e3:.1f} ms)")
+
+
+class LivePlot:
+    """
+    Desktop live plot of the acceleration traces and a 3D view of the phone orientation.
+    The line artists are created once and updated with set_data, frames are blitted,
+    and the axes limits only change when the data leaves them.
+    read_new() returns (rows, total, quaternion): the new (n, 4) rows of timestamp, x, y, z (or None),
+    the number of rows read so far and the latest (x, y, z, w) orientation (or None).
+    """
+
+    def __init__(self, figure, read_new, window_rows=5000, lod_points=2000, window_seconds=14.0,
+                 orientation=True, report_interval=5.0):
+        self.figure = figure
+        self.read_new = read_new
+        self.window_rows = window_rows
+        self.window_seconds = window_seconds
+        self.report_interval = report_interval
+        self.window = None
+        self.lod = [Decimator(window_rows, lod_points, 'minmax') for _ in range(3)]
+        self.clock = FrameClock()
+        self.last_report = time.perf_counter()
+
+        self.ax = figure.add_subplot(1, 2 if orientation else 1, 1)
+        self.ax.set_xlim(0, window_seconds)
+        self.ax.set_ylim(-2, 2)
+        self.lines = [self.ax.plot([], [], linewidth=1)[0] for _ in range(3)]
+        # Part of the background, it is only redrawn with the report
+        self.status = self.ax.text(0.01, 0.98, '', transform=self.ax.transAxes, va='top', fontsize=8)
+        artists = list(self.lines)
+
+        self.axes_3d = None
+        if orientation:
+            self.ax_3d = figure.add_subplot(1, 2, 2, projection='3d')
+            self.ax_3d.set_xlim(-1, 1)
+            self.ax_3d.set_ylim(-1, 1)
+            self.ax_3d.set_zlim(-1, 1)
+            self.ax_3d.set_box_aspect((1, 1, 1))
+            self.axes_3d = [self.ax_3d.plot([0, 1], [0, 0], [0, 0], color=color, linewidth=3)[0]
+                            for color in BODY_COLORS]
+            self.set_orientation((0.0, 0.0, 0.0, 1.0))
+            artists += self.axes_3d
+        self.blitter = Blitter(figure.canvas, artists)
+
+    def set_orientation(self, q):
+        for line, tip in zip(self.axes_3d, body_axes(q)):
+            line.set_data_3d([0.0, tip[0]], [0.0, tip[1]], [0.0, tip[2]])
+
+    def rescale(self):
+        # New limits only when the newest samples are outside the current ones, returns whether they changed
+        time = self.window[:, 0]
+        changed = False
+        left, right = self.ax.get_xlim()
+        if time[-1] > right or time[-1] < left:
+            # The time axis jumps by half a window, the newest sample lands in the middle
+            self.ax.set_xlim(time[-1] - self.window_seconds / 2, time[-1] + self.window_seconds / 2)
+            changed = True
+        bottom, top = self.ax.get_ylim()
+        values = self.window[time >= self.ax.get_xlim()[0], 1:]
+        low, high = values.min(), values.max()
+        if low < bottom or high > top:
+            margin = 0.1 * (max(high, top) - min(low, bottom))
+            self.ax.set_ylim(min(low, bottom) - margin, max(high, top) + margin)
+            changed = True
+        return changed
+
+    def update(self, *args):
+        start = time.perf_counter()
+        new, total, quaternion = self.read_new()
+        changed = False
+        if new is not None and len(new):
+            new = new[-self.window_rows:]
+            if self.window is None:
+                self.window = new
+            else:
+                self.window = np.concatenate((self.window, new))[-self.window_rows:]
+            first = total - len(self.window)
+            for axis, (line, decimator) in enumerate(zip(self.lines, self.lod), 1):
+                line.set_data(*decimator.decimate(self.window[:, 0], self.window[:, axis], first))
+            changed = self.rescale()
+        if quaternion is not None and self.axes_3d is not None and np.all(np.isfinite(quaternion)):
+            self.set_orientation(quaternion)
+
+        if start - self.last_report >= self.report_interval:
+            self.last_report = start
+            line = self.clock.report()
+            self.status.set_text(line)
+            print("plot:", line)
+            changed = True
+
+        if changed:
+            self.blitter.full_redraw()
+        else:
+            self.blitter.redraw()
+        self.clock.frame(time.perf_counter() - start)
+
+    def run(self, fps=60):
+        # A plain canvas timer, FuncAnimation's own blitting would keep the stale ticks after a rescale
+        timer = self.figure.canvas.new_timer(interval=int(1000 / fps))
+        timer.add_callback(self.update)
+        timer.start()
+        return timer
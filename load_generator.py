@@ -0,0 +1,362 @@
+import argparse
+import asyncio
+import http.client
+import json
+import multiprocessing
+import time
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import wire_protocol
+from fusion import rotate_to_body
+from gyro import quat_multiply
+from ws_server import WebSocketServer, encode_frame
+
+TICK = 0.005  # Seconds between send rounds, every round sends all samples that are due
+HIGH_WATER = 1 << 20  # Bytes buffered to a websocket client before samples are dropped
+
+
+def euler_quaternion(cr, sr, cp, sp, cy, sy):
+    # (x, y, z, w) quaternion of roll, pitch, yaw from the cosines and sines of the half angles
+    return np.column_stack((
+        sr * cp * cy - cr * sp * sy,
+        cr * sp * cy + sr * cp * sy,
+        cr * cp * sy - sr * sp * cy,
+        cr * cp * cy + sr * sp * sy,
+    ))
+
+
+class SyntheticMotion:
+    """
+    Smooth rotation around all three axes with an oscillating linear acceleration and sensor noise.
+    """
+
+    def __init__(self, seed=0):
+        rng = np.random.default_rng(seed)
+        self.phase = rng.uniform(0, 2 * np.pi, 3)
+        self.freq = rng.uniform(0.2, 0.8, 3)
+        self.amp = np.array([0.4, 0.3, 1.0])
+        self.rng = rng
+
+    def sample(self, t):
+        # t is an (n,) array of seconds since the start of the stream
+        arg = np.outer(t, self.freq) + self.phase
+        roll, pitch, yaw = (self.amp * np.sin(arg)).T
+        roll_rate, pitch_rate, yaw_rate = (self.amp * self.freq * np.cos(arg)).T
+
+        cr, sr = np.cos(roll / 2), np.sin(roll / 2)
+        cp, sp = np.cos(pitch / 2), np.sin(pitch / 2)
+        cy, sy = np.cos(yaw / 2), np.sin(yaw / 2)
+        quaternion = euler_quaternion(cr, sr, cp, sp, cy, sy)
+        # The quaternion is linear in every (cos, sin) pair, so each partial derivative is the same
+        # product with d(cos, sin)/d(angle) = (-sin / 2, cos / 2)
+        derivative = (euler_quaternion(-sr / 2, cr / 2, cp, sp, cy, sy) * roll_rate[:, None]
+                      + euler_quaternion(cr, sr, -sp / 2, cp / 2, cy, sy) * pitch_rate[:, None]
+                      + euler_quaternion(cr, sr, cp, sp, -sy / 2, cy / 2) * yaw_rate[:, None])
+        # Body frame angular velocity w = 2 * q^-1 * dq/dt, the rates a gyroscope on the phone measures
+        conjugate = quaternion * (-1.0, -1.0, -1.0, 1.0)
+        gyro = 2.0 * quat_multiply(conjugate, derivative)[:, :3] + self.rng.normal(0, 0.01, arg.shape)
+        acc = 0.5 * np.sin(2 * np.pi * np.outer(t, self.freq * 3)) + self.rng.normal(0, 0.05, arg.shape)
+        euler = np.degrees(np.column_stack((yaw, pitch, roll)))
+        # Gravity in the phone frame, Sensor Logger sends it apart from the (linear) accelerometer
+        gravity = rotate_to_body(quaternion, np.tile((0.0, 0.0, 9.81), (len(t), 1)))
+        return {'quaternion': quaternion, 'acc': acc, 'gyro': gyro, 'euler': euler, 'gravity': gravity}
+
+
+class RecordedMotion(SyntheticMotion):
+    """
+    Replays the acceleration of a columnar recording (graphics.bin) in a loop, orientation stays synthetic.
+    """
+
+    def __init__(self, path, rate, seed=0):
+        from columnar_log import ColumnarTailReader
+        super().__init__(seed)
+        self.rate = rate
+        rows = ColumnarTailReader(path).tail(1 << 62)
+        if rows is None:
+            raise ValueError(f"{path} has no recorded samples")
+        self.recorded = np.column_stack((rows['x'], rows['y'], rows['z']))
+
+    def sample(self, t):
+        data = super().sample(t)
+        index = np.round(t * self.rate).astype(int) % len(self.recorded)
+        data['acc'] = self.recorded[index]
+        return data
+
+
+class LoadStats:
+    def __init__(self):
+        self.sent = 0
+        self.dropped = 0
+        self.received = 0
+        self.malformed = 0
+        self.latencies = []  # Seconds, since the last report
+        self.all_latencies = []
+        self.last_sent = 0
+        self.started = self.last_report = time.perf_counter()
+        self.finished = None  # When sending stopped, the final rate does not count the shutdown
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def add_latency(self, seconds):
+        self.latencies.append(seconds)
+
+    def line(self, final=False):
+        now = time.perf_counter()
+        if final:
+            rate = self.sent / ((self.finished or now) - self.started)
+        else:
+            rate = (self.sent - self.last_sent) / (now - self.last_report)
+        self.last_sent, self.last_report = self.sent, now
+        txt = f"sent {self.sent} ({rate:.0f}/s) dropped {self.dropped}"
+        if self.received:
+            txt += f" received {self.received} malformed {self.malformed}"
+        window = self.latencies
+        self.all_latencies.extend(window)
+        self.latencies = []
+        latencies = self.all_latencies if final else window
+        if latencies:
+            latencies = np.array(latencies) * 1e3
+            txt += f" latency p50 {np.percentile(latencies, 50):.2f} ms p99 {np.percentile(latencies, 99):.2f} ms"
+        return txt
+
+
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.stats = LoadStats()
+        self.stopped = False
+        self.sink_queue = None
+
+    def new_motion(self, device_id):
+        if self.args.replay:
+            return RecordedMotion(self.args.replay, self.args.rate, seed=device_id)
+        return SyntheticMotion(seed=device_id)
+
+    async def stream(self, device_id, send):
+        """
+        Calls send(t, data) with every batch of samples that is due, at rate * speed samples per second.
+        """
+        motion = self.new_motion(device_id)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        count = 0
+        while not self.stopped:
+            due = int((loop.time() - start) * self.args.rate * self.args.speed) - count
+            if due > 0:
+                t = (count + np.arange(due)) / self.args.rate
+                await send(t, motion.sample(t))
+                count += due
+            await asyncio.sleep(TICK)
+
+    # TCP_server: newline delimited JSON, or wire_protocol records with --binary
+    async def tcp_device(self, device_id):
+        reader, writer = await asyncio.open_connection(self.args.host, self.args.port)
+        base_ns = time.time_ns()
+        if self.args.binary:
+            writer.write(wire_protocol.STREAM_MAGIC)
+
+        async def send_binary(t, data):
+            # One rotation vector and one linear acceleration record per sample
+            timestamps = base_ns + (t * 1e9).astype(np.int64)
+            writer.write(wire_protocol.encode_records(wire_protocol.SENSOR_ROTATION_VECTOR, timestamps,
+                                                      data['quaternion'])
+                         + wire_protocol.encode_records(wire_protocol.SENSOR_LINEAR_ACCELERATION, timestamps,
+                                                        data['acc']))
+            await writer.drain()
+            self.stats.sent += 2 * len(t)
+
+        async def send(t, data):
+            now = time.time_ns()
+            rot = np.column_stack((data['quaternion'], np.zeros(len(t))))
+            lines = [
+                json.dumps({
+                    'rotationVectorData': r, 'linearAccelerationData': a,
+                    'timestamp': base_ns + int(ts * 1e9), 'sendTime': now,
+                })
+                for r, a, ts in zip(rot.tolist(), data['acc'].tolist(), t.tolist())
+            ]
+            writer.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            await writer.drain()
+            self.stats.sent += len(t)
+
+        try:
+            await self.stream(device_id, send_binary if self.args.binary else send)
+        finally:
+            writer.close()
+
+    # app.py: Sensor Logger POST payloads
+    async def http_device(self, device_id):
+        loop = asyncio.get_running_loop()
+        connection = http.client.HTTPConnection(self.args.host, self.args.port, timeout=10)
+        base_ns = time.time_ns()
+
+        def post(body):
+            start = time.perf_counter()
+            connection.request('POST', '/data', body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            return response.status, time.perf_counter() - start
+
+        async def send(t, data):
+            payload = []
+            for ts, a, g, q, down in zip(t.tolist(), data['acc'].tolist(), data['gyro'].tolist(),
+                                         data['quaternion'].tolist(), data['gravity'].tolist()):
+                ns = base_ns + int(ts * 1e9)
+                payload.append({'name': 'accelerometer', 'time': ns, 'values': dict(zip('xyz', a))})
+                payload.append({'name': 'gyroscope', 'time': ns, 'values': dict(zip('xyz', g))})
+                payload.append({'name': 'gravity', 'time': ns, 'values': dict(zip('xyz', down))})
+                payload.append({'name': 'orientation', 'time': ns,
+                                'values': dict(zip(('qx', 'qy', 'qz', 'qw'), q))})
+            try:
+                status, latency = await loop.run_in_executor(None, post, json.dumps({'payload': payload}))
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status, latency = None, None
+            if status == 200:
+                self.stats.sent += len(t)
+                self.stats.add_latency(latency)
+            else:
+                self.stats.dropped += len(t)
+
+        try:
+            await self.stream(device_id, send)
+        finally:
+            connection.close()
+
+    # appv2.py: the generator plays the phone's websocket sensor server
+    async def ws_client(self, connection):
+        sensor = parse_qs(urlparse(connection.path).query).get('type', ['android.sensor.orientation'])[0]
+        key = 'euler' if 'orientation' in sensor else 'gyro' if 'gyroscope' in sensor else 'acc'
+        transport = connection.writer.transport
+        device_id = id(connection) & 0xFFFF
+        base_ns = time.time_ns()
+        receiver = asyncio.ensure_future(connection.receive())
+
+        async def send(t, data):
+            if receiver.done():
+                # The client closed the connection
+                raise ConnectionResetError
+            if transport.get_write_buffer_size() > HIGH_WATER:
+                # The client is not keeping up, drop like the phone would
+                self.stats.dropped += len(t)
+                return
+            for ts, values in zip(t.tolist(), data[key].tolist()):
+                connection.writer.write(encode_frame(json.dumps({
+                    'values': values, 'timestamp': base_ns + int(ts * 1e9), 'accuracy': 3,
+                })))
+            self.stats.sent += len(t)
+
+        try:
+            await self.stream(device_id, send)
+        finally:
+            receiver.cancel()
+
+    async def run(self):
+        protocol = self.args.protocol
+        if protocol == 'tcp' and self.args.local:
+            self.start_local_sink()
+        server = None
+        if protocol == 'ws':
+            server = WebSocketServer(self.ws_client, self.args.host, self.args.port)
+            await server.start()
+            print(f"Websocket sensor stand-in on ws://{self.args.host}:{self.args.port}/sensor/connect?type=...")
+            tasks = []
+        else:
+            device = self.tcp_device if protocol == 'tcp' else self.http_device
+            tasks = [asyncio.ensure_future(device(i)) for i in range(self.args.devices)]
+
+        end = time.perf_counter() + self.args.duration
+        while time.perf_counter() < end:
+            await asyncio.sleep(1)
+            self.poll_sink()
+            print(self.stats.line())
+            failed = [task for task in tasks if task.done()]
+            if failed and len(failed) == len(tasks):
+                failed[0].result()
+        self.stopped = True
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.stats.stop()
+        if server is not None:
+            server.close()
+        self.stop_local_sink()
+        print("total:", self.stats.line(final=True))
+
+    def start_local_sink(self):
+        ctx = multiprocessing.get_context('spawn')
+        self.sink_queue = ctx.Queue()
+        ready = ctx.Event()
+        self.sink = ctx.Process(target=run_local_sink, args=(self.args.host, self.args.port, self.sink_queue, ready),
+                                daemon=True)
+        self.sink.start()
+        ready.wait(10)
+
+    def poll_sink(self):
+        while self.sink_queue is not None and not self.sink_queue.empty():
+            received, malformed, latencies = self.sink_queue.get()
+            self.stats.received, self.stats.malformed = received, malformed
+            self.stats.latencies.extend(latencies)
+
+    def stop_local_sink(self):
+        if self.sink_queue is None:
+            return
+        # Let the sink catch up before counting what never arrived
+        time.sleep(1.5)
+        self.poll_sink()
+        self.stats.dropped += max(0, self.stats.sent - self.stats.received)
+        self.sink.terminate()
+
+
+def run_local_sink(host, port, queue, ready):
+    """
+    Runs an AsyncTCPServer in its own process and reports received frames and end-to-end latency.
+    """
+    from async_tcp_server import AsyncTCPServer
+    latencies = []
+    frames = dict()  # Kept after disconnects so the totals do not drop
+
+    def on_update(session):
+        frames[session.addr] = (session.reassembler.frame_count, session.reassembler.malformed_count)
+        frame = session.last_frame
+        if frame is not None and 'sendTime' in frame:
+            latencies.append((time.time_ns() - frame['sendTime']) / 1e9)
+
+    async def main():
+        server = AsyncTCPServer(host, port, on_update=on_update)
+        await server.start()
+        ready.set()
+        while True:
+            await asyncio.sleep(0.5)
+            received = sum(f[0] for f in frames.values())
+            malformed = sum(f[1] for f in frames.values())
+            queue.put((received, malformed, latencies[:]))
+            latencies.clear()
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic sensor stream load generator for the ingest paths")
+    parser.add_argument('protocol', choices=('tcp', 'http', 'ws'),
+                        help="tcp: TCP_server NDJSON, http: app.py /data, ws: websocket stand-in for appv2.py")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help="defaults to 9885 (tcp), 8000 (http) or 8080 (ws)")
+    parser.add_argument('--devices', type=int, default=1, help="simulated devices (tcp and http)")
+    parser.add_argument('--rate', type=float, default=100, help="samples per second per device")
+    parser.add_argument('--speed', type=float, default=1, help="real time multiple")
+    parser.add_argument('--duration', type=float, default=10, help="seconds")
+    parser.add_argument('--replay', help="columnar recording (graphics.bin) to replay instead of synthetic motion")
+    parser.add_argument('--local', action='store_true',
+                        help="tcp only: run an AsyncTCPServer sink in a separate process to measure latency and drops")
+    parser.add_argument('--binary', action='store_true',
+                        help="tcp only: send fixed layout binary records (wire_protocol), sent counts records")
+    args = parser.parse_args()
+    if args.port is None:
+        args.port = {'tcp': 9885, 'http': 8000, 'ws': 8080}[args.protocol]
+    asyncio.run(LoadGenerator(args).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+import bisect
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+
+# Latency buckets in seconds, 10 µs to 10 s
+DEFAULT_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    # Plain attribute increments, cheap enough for the per packet paths (concurrent increments may rarely be lost)
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, observe() takes seconds.
+    time() is a context manager that observes the duration of its block.
+    """
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q quantile
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float('inf')
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {total}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Registry:
+    """
+    The metrics of one process, rendered in the Prometheus text format or as a one line summary.
+    """
+
+    def __init__(self):
+        self.metrics = dict()
+        self.lock = threading.Lock()
+
+    def counter(self, name, help_text=''):
+        return self.__get(Counter, name, help_text)
+
+    def histogram(self, name, help_text='', buckets=DEFAULT_BUCKETS):
+        return self.__get(Histogram, name, help_text, buckets)
+
+    def __get(self, cls, name, *args):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args)
+            return metric
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def drain(self):
+        """
+        Current values of the metrics as picklable data, and resets them.
+        Worker processes send this to the parent, which adds it to its own registry with merge().
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        drained = dict()
+        for m in metrics:
+            if isinstance(m, Counter):
+                if m.value:
+                    drained[m.name] = ('counter', m.help, m.value)
+                    m.value = 0
+            elif m.count:
+                drained[m.name] = ('histogram', m.help, (m.buckets, m.counts, m.sum, m.count))
+                m.counts = [0] * (len(m.buckets) + 1)
+                m.sum = 0.0
+                m.count = 0
+        return drained
+
+    def merge(self, drained):
+        for name, (kind, help_text, value) in drained.items():
+            if kind == 'counter':
+                self.counter(name, help_text).inc(value)
+                continue
+            buckets, counts, total, count = value
+            histogram = self.histogram(name, help_text, buckets)
+            histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+            histogram.sum += total
+            histogram.count += count
+
+    def snapshot(self):
+        # Counter values and histogram (count, sum)
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {m.name: m.value if isinstance(m, Counter) else (m.count, m.sum) for m in metrics}
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text=''):
+    return REGISTRY.counter(name, help_text)
+
+
+def histogram(name, help_text='', buckets=DEFAULT_BUCKETS):
+    return REGISTRY.histogram(name, help_text, buckets)
+
+
+# Hot path metrics shared by the ingest servers and the dashboard
+BYTES_RECEIVED = counter('imu_bytes_received_total', "Bytes read from sensor connections")
+FRAMES_PARSED = counter('imu_frames_parsed_total', "Complete frames split from the sensor streams")
+DECODE_FAILURES = counter('imu_decode_failures_total', "Frames that were not valid JSON objects")
+INTEGRATION_SECONDS = histogram('imu_integration_seconds', "Time spent integrating acceleration and gyroscope blocks")
+FLUSH_SECONDS = histogram('imu_flush_seconds', "Latency of writing and flushing a recorder channel")
+CALLBACK_SECONDS = histogram('imu_dashboard_callback_seconds', "Time spent in the dashboard update callback")
+
+
+class StatsReporter:
+    """
+    Prints a line with counter rates and histogram p50/p99 every interval seconds from a daemon thread.
+    """
+
+    def __init__(self, interval=5.0, registry=REGISTRY, prefix='stats:'):
+        self.interval = interval
+        self.registry = registry
+        self.prefix = prefix
+        self.last = registry.snapshot()
+        self.last_time = time.perf_counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__run, name='stats', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def line(self):
+        now = time.perf_counter()
+        elapsed = now - self.last_time
+        snapshot = self.registry.snapshot()
+        parts = []
+        for name, value in snapshot.items():
+            short = name.replace('imu_', '').replace('_total', '').replace('_seconds', '')
+            metric = self.registry.metrics[name]
+            if isinstance(metric, Counter):
+                rate = (value - self.last.get(name, 0)) / elapsed
+                parts.append(f"{short} {value} ({rate:.0f}/s)")
+            elif metric.count:
+                parts.append(f"{short} p50 {metric.quantile(0.5) * 1e3:g} ms p99 {metric.quantile(0.99) * 1e3:g} ms")
+        self.last, self.last_time = snapshot, now
+        return ' | '.join(parts)
+
+    def __run(self):
+        while not self.stopped.wait(self.interval):
+            print(self.prefix, self.line())
+
+
+class SamplingProfiler:
+    """
+    Opt-in statistical profiler, samples the stacks of all other threads every interval seconds.
+    collapsed() returns the stacks in the folded format of flamegraph.pl / speedscope.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = StackCounter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.__run, name='profiler', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + '\n'
+
+
+def profiling_enabled():
+    # The profiler hooks are only installed with IMU_PROFILE=1
+    return os.environ.get('IMU_PROFILE', '') not in ('', '0')
+
+
+def profile(seconds):
+    # Samples the running process for a number of seconds, returns the collapsed stacks
+    profiler = SamplingProfiler().start()
+    time.sleep(seconds)
+    profiler.stop()
+    return profiler.collapsed()
+
+
+def install_profile_signal(output_dir, seconds=10.0):
+    """
+    With IMU_PROFILE=1, SIGUSR1 captures a profile of the next seconds into output_dir/profile-<time>.folded.
+    """
+    if not profiling_enabled() or not hasattr(signal, 'SIGUSR1'):
+        return False
+
+    def capture():
+        path = os.path.join(output_dir, f"profile-{int(time.time())}.folded")
+        with open(path, 'w') as f:
+            f.write(profile(seconds))
+        print("Profile written to", path)
+
+    signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=capture, daemon=True).start())
+    return True
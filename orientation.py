@@ -0,0 +1,63 @@
+import math
+
+import numpy as np
+
+
+def quaternion_to_euler(quaternions, degrees=False):
+    """
+    Convert an (n, 4) array of quaternions in (x, y, z, w) order into an (n, 3)
+    array of euler angles (roll, pitch, yaw), rotations around x, y and z.
+    """
+    q = np.asarray(quaternions, dtype=float).reshape(-1, 4)
+    x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+
+    euler = np.empty((len(q), 3))
+    euler[:, 0] = np.arctan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y))
+    euler[:, 1] = np.arcsin(np.clip(2.0 * (w * y - z * x), -1.0, 1.0))
+    euler[:, 2] = np.arctan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+    if degrees:
+        np.degrees(euler, out=euler)
+    return euler
+
+
+def rotvec_to_quaternion(rotvecs):
+    """
+    Convert an (n, 3) array of rotation vectors (axis * angle) into (n, 4) quaternions in (x, y, z, w) order.
+    """
+    rv = np.asarray(rotvecs, dtype=float).reshape(-1, 3)
+    angle = np.linalg.norm(rv, axis=1)
+    half = 0.5 * angle
+    # sin(angle / 2) / angle, with the Taylor expansion near zero to avoid dividing by zero
+    small = angle < 1e-6
+    scale = np.where(small, 0.5 - angle * angle / 48.0, np.sin(half) / np.where(small, 1.0, angle))
+
+    q = np.empty((len(rv), 4))
+    q[:, :3] = rv * scale[:, None]
+    q[:, 3] = np.cos(half)
+    return q
+
+
+def rotvec_to_euler(rotvecs, degrees=False):
+    """
+    Convert an (n, 3) array of rotation vectors into (n, 3) euler angles,
+    the same angles as scipy's Rotation.from_rotvec(rotvecs).as_euler('xyz').
+    """
+    return quaternion_to_euler(rotvec_to_quaternion(rotvecs), degrees=degrees)
+
+
+# Single sample versions for the per packet paths, NumPy costs tens of microseconds per call
+# on one sample. They use the same formulas as the array kernels above.
+
+def quaternion_to_euler_scalar(x, y, z, w, degrees=False):
+    roll_x = math.atan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y))
+    pitch_y = math.asin(min(1.0, max(-1.0, 2.0 * (w * y - z * x))))
+    yaw_z = math.atan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+    if degrees:
+        return math.degrees(roll_x), math.degrees(pitch_y), math.degrees(yaw_z)
+    return roll_x, pitch_y, yaw_z
+
+
+def rotvec_to_euler_scalar(x, y, z, degrees=False):
+    angle = math.sqrt(x * x + y * y + z * z)
+    scale = 0.5 - angle * angle / 48.0 if angle < 1e-6 else math.sin(0.5 * angle) / angle
+    return quaternion_to_euler_scalar(x * scale, y * scale, z * scale, math.cos(0.5 * angle), degrees)
@@ -0,0 +1,151 @@
+import multiprocessing
+import queue
+import threading
+
+from metrics import REGISTRY
+
+STOP = None
+BATCH = 64  # Chunks a parse worker takes from its queue per round
+
+
+def queue_depth(q):
+    # multiprocessing.Queue.qsize is not implemented on macOS
+    try:
+        return q.qsize()
+    except NotImplementedError:
+        return -1
+
+
+def parse_worker(inbox, outbox, frame_schemas=None):
+    """
+    Parse and compute stage, runs in its own process.
+    Keeps a DeviceSession (frame buffer, rotation vector, linear acceleration) for every device routed to it
+    and sends one (quaternion, position, acceleration) result per received chunk to the persist stage,
+    with the metrics counted in this process since the previous batch.
+    frame_schemas replaces sensor_decoder.FRAME_SCHEMAS for the JSON frames.
+    """
+    from async_tcp_server import DeviceSession
+    sessions = dict()
+    running = True
+    while running:
+        items = [inbox.get()]
+        while len(items) < BATCH:
+            try:
+                items.append(inbox.get_nowait())
+            except queue.Empty:
+                break
+
+        results = []
+        for item in items:
+            if item is STOP:
+                running = False
+                break
+            device, chunk = item
+            if chunk is None:
+                # The device disconnected
+                sessions.pop(device, None)
+                continue
+            session = sessions.get(device)
+            if session is None:
+                session = sessions[device] = DeviceSession(device, frame_schemas)
+            session.reassembler.feed(chunk)
+            session.extract_sensor_data()
+            results.append((device, session.rot_vec.get_orientation(),
+                            tuple(session.linear_acc.get_position()), session.linear_acc.get_data()))
+        if results:
+            outbox.put((results, REGISTRY.drain()))
+    outbox.put(STOP)
+
+
+class IngestPipeline:
+    """
+    Receive -> parse/compute -> persist pipeline for the ingest server.
+    Receive and persist run as threads of this process, parsing and integration run in worker processes.
+    Every device is routed to the same worker, which keeps its sensor state.
+    The stages are connected by bounded queues, a full queue blocks the stage in front of it
+    but the socket reads never wait on the disk.
+    on_result(device, quaternion, position, acc_data) is called from the persist thread.
+    """
+
+    def __init__(self, on_result, workers=2, queue_size=256, read_size=64 * 1024, frame_schemas=None):
+        ctx = multiprocessing.get_context('spawn')
+        self.on_result = on_result
+        self.read_size = read_size
+        self.inboxes = [ctx.Queue(queue_size) for _ in range(workers)]
+        self.outbox = ctx.Queue(queue_size)
+        self.workers = [ctx.Process(target=parse_worker, args=(inbox, self.outbox, frame_schemas), daemon=True)
+                        for inbox in self.inboxes]
+        self.persister = threading.Thread(target=self.__persist, daemon=True)
+        self.receivers = []
+        self.received_bytes = 0
+        self.received_chunks = 0
+        self.persisted = 0
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self.persister.start()
+
+    def shard(self, device):
+        return hash(device) % len(self.inboxes)
+
+    def receive(self, sock, device):
+        # Starts the receive stage of a connected socket, device is any hashable id (the peer address)
+        thread = threading.Thread(target=self.__receive, args=(sock, device), daemon=True)
+        thread.start()
+        self.receivers.append(thread)
+        return thread
+
+    def __receive(self, sock, device):
+        inbox = self.inboxes[self.shard(device)]
+        buffer = bytearray(self.read_size)
+        view = memoryview(buffer)
+        while True:
+            n = sock.recv_into(buffer)
+            if not n:
+                break
+            self.received_bytes += n
+            self.received_chunks += 1
+            inbox.put((device, view[:n].tobytes()))
+        inbox.put((device, None))
+
+    def __persist(self):
+        stopped = 0
+        while stopped < len(self.workers):
+            item = self.outbox.get()
+            if item is STOP:
+                stopped += 1
+                continue
+            results, worker_metrics = item
+            # Bytes, frames and integration times are counted in the workers, the stats line reads this process
+            REGISTRY.merge(worker_metrics)
+            for result in results:
+                self.on_result(*result)
+            self.persisted += len(results)
+
+    def queue_depths(self):
+        return {
+            'parse': [queue_depth(inbox) for inbox in self.inboxes],
+            'persist': queue_depth(self.outbox),
+        }
+
+    def get_stats(self):
+        return {
+            'received_bytes': self.received_bytes,
+            'received_chunks': self.received_chunks,
+            'persisted': self.persisted,
+            'queues': self.queue_depths(),
+        }
+
+    def running(self):
+        return any(thread.is_alive() for thread in self.receivers)
+
+    def close(self):
+        # Waits for the receivers, then drains the parse and persist stages in order
+        for thread in self.receivers:
+            thread.join()
+        for inbox in self.inboxes:
+            inbox.put(STOP)
+        self.persister.join()
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,204 @@
+import atexit
+import os
+import threading
+
+import numpy as np
+
+from columnar_log import ColumnarWriter
+from metrics import FLUSH_SECONDS
+
+# Output directory for all recordings, override with the IMU_OUTPUT_DIR environment variable
+OUTPUT_DIR = os.environ.get('IMU_OUTPUT_DIR', os.path.join(os.path.expanduser('~'), 'Desktop'))
+
+
+class RecorderChannel:
+    """
+    One text log with a persistent file handle.
+    Rows are collected in preallocated NumPy blocks and written by the recorder thread.
+    """
+
+    def __init__(self, recorder, path, columns, delimiter, block_rows):
+        self.recorder = recorder
+        self.path = path
+        self.columns = columns
+        self.delimiter = delimiter
+        self.block_rows = block_rows
+        self.file = self._open(path)
+        self.block = np.empty((block_rows, columns))
+        self.rows = 0
+        self.full_blocks = []
+        self.free_blocks = []
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.row_count = 0
+
+    def append(self, row):
+        with self.lock:
+            self.block[self.rows] = row
+            self.rows += 1
+            self.row_count += 1
+            if self.rows < self.block_rows:
+                return
+            self.full_blocks.append(self.block)
+            self.block = self._new_block()
+            self.rows = 0
+        # Size policy, wake the writer as soon as a block is full
+        self.recorder.wake()
+
+    def extend(self, rows):
+        # Appends an (n, columns) array of rows, filling whole blocks at a time
+        rows = np.asarray(rows, dtype=float).reshape(-1, self.columns)
+        full = False
+        with self.lock:
+            while len(rows):
+                n = min(len(rows), self.block_rows - self.rows)
+                self.block[self.rows:self.rows + n] = rows[:n]
+                self.rows += n
+                self.row_count += n
+                rows = rows[n:]
+                if self.rows == self.block_rows:
+                    self.full_blocks.append(self.block)
+                    self.block = self._new_block()
+                    self.rows = 0
+                    full = True
+        if full:
+            self.recorder.wake()
+
+    def _open(self, path):
+        return open(path, 'a')
+
+    def _write_block(self, block):
+        np.savetxt(self.file, block, fmt='%s', delimiter=self.delimiter)
+
+    def _new_block(self):
+        if self.free_blocks:
+            return self.free_blocks.pop()
+        return np.empty((self.block_rows, self.columns))
+
+    def take(self):
+        with self.lock:
+            blocks = self.full_blocks
+            self.full_blocks = []
+            if self.rows:
+                blocks.append(self.block[:self.rows])
+                self.block = self._new_block()
+                self.rows = 0
+        return blocks
+
+    def write(self):
+        # write_lock keeps blocks in order when flush() races the writer thread
+        with self.write_lock:
+            blocks = self.take()
+            if not blocks:
+                return
+            with FLUSH_SECONDS.time():
+                for block in blocks:
+                    self._write_block(block)
+                self.file.flush()
+        with self.lock:
+            for block in blocks:
+                if block.base is None and len(self.free_blocks) < 2:
+                    self.free_blocks.append(block)
+
+    def close(self):
+        self.write()
+        with self.write_lock:
+            self.file.close()
+
+
+class ColumnarRecorderChannel(RecorderChannel):
+    """
+    Same batching as RecorderChannel but written in the binary columnar format (see columnar_log).
+    """
+
+    def __init__(self, recorder, path, columns, block_rows):
+        self.column_spec = columns
+        super().__init__(recorder, path, len(columns), None, block_rows)
+
+    def _open(self, path):
+        return ColumnarWriter(path, self.column_spec)
+
+    def _write_block(self, block):
+        self.file.write(block)
+
+
+class Recorder:
+    """
+    Batched writer for the text logs (orientation.txt, position.txt, ...).
+    Channels are flushed when a block fills up or every flush_interval seconds.
+    """
+
+    def __init__(self, output_dir=None, block_rows=4096, flush_interval=1.0):
+        self.output_dir = output_dir if output_dir is not None else OUTPUT_DIR
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.block_rows = block_rows
+        self.flush_interval = flush_interval
+        self.channels = dict()
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self.__run, name='recorder', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def channel(self, name, columns, delimiter=';'):
+        with self.lock:
+            if name not in self.channels:
+                path = os.path.join(self.output_dir, name)
+                self.channels[name] = RecorderChannel(self, path, columns, delimiter, self.block_rows)
+            return self.channels[name]
+
+    def columnar_channel(self, name, columns):
+        with self.lock:
+            if name not in self.channels:
+                path = os.path.join(self.output_dir, name)
+                self.channels[name] = ColumnarRecorderChannel(self, path, columns, self.block_rows)
+            return self.channels[name]
+
+    def append(self, name, row):
+        self.channels[name].append(row)
+
+    def close_channel(self, name):
+        # Writes what is left and closes the file, a later channel() with the same name opens it again
+        with self.lock:
+            channel = self.channels.pop(name, None)
+        if channel is not None:
+            channel.close()
+
+    def wake(self):
+        self.event.set()
+
+    def flush(self):
+        with self.lock:
+            channels = list(self.channels.values())
+        for channel in channels:
+            channel.write()
+
+    def __run(self):
+        while self.running:
+            # Time policy, flush at least once every flush_interval
+            self.event.wait(self.flush_interval)
+            self.event.clear()
+            self.flush()
+
+    def close(self):
+        if not self.running:
+            return
+        self.running = False
+        self.event.set()
+        self.thread.join()
+        with self.lock:
+            for channel in self.channels.values():
+                channel.close()
+        atexit.unregister(self.close)
+
+
+_default_recorder = None
+
+
+def get_recorder():
+    # Shared recorder for the scripts, created on first use
+    global _default_recorder
+    if _default_recorder is None:
+        _default_recorder = Recorder()
+    return _default_recorder
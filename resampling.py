@@ -0,0 +1,137 @@
+import numpy as np
+
+
+def slerp(q0, q1, u):
+    """
+    Spherical linear interpolation between (n, 4) quaternion arrays (x, y, z, w) at fractions u (n,).
+    """
+    dot = np.sum(q0 * q1, axis=1)
+    # q and -q are the same rotation, take the short way round
+    q1 = np.where(dot[:, None] < 0, -q1, q1)
+    dot = np.abs(dot)
+    theta = np.arccos(np.clip(dot, -1.0, 1.0))
+    sin_theta = np.sin(theta)
+    close = sin_theta < 1e-6
+    safe = np.where(close, 1.0, sin_theta)
+    w0 = np.where(close, 1.0 - u, np.sin((1.0 - u) * theta) / safe)
+    w1 = np.where(close, u, np.sin(u * theta) / safe)
+    q = w0[:, None] * q0 + w1[:, None] * q1
+    return q / np.linalg.norm(q, axis=1)[:, None]
+
+
+class StreamBuffer:
+    """
+    Timestamped samples of one sensor, kept until the common clock has passed them.
+    """
+
+    def __init__(self, width, method='linear'):
+        if method not in ('linear', 'slerp'):
+            raise ValueError(f"Unknown interpolation {method}")
+        self.method = method
+        self.times = np.empty(0)
+        self.values = np.empty((0, width))
+
+    def __len__(self):
+        return len(self.times)
+
+    def last_time(self):
+        return self.times[-1] if len(self.times) else None
+
+    def add(self, times, values):
+        times = np.asarray(times, dtype=float)
+        values = np.asarray(values, dtype=float).reshape(len(times), -1)
+        order = np.argsort(times, kind='stable')
+        times, values = times[order], values[order]
+        # Only strictly increasing timestamps, late and duplicate samples are dropped
+        last = self.times[-1] if len(self.times) else -np.inf
+        keep = (np.diff(times, prepend=-np.inf) > 0) & (times > last)
+        self.times = np.concatenate((self.times, times[keep]))
+        self.values = np.concatenate((self.values, values[keep]))
+
+    def interpolate(self, ticks):
+        # Values at the ticks, held at the first / last sample outside the buffered range
+        if len(self.times) == 1:
+            return np.repeat(self.values, len(ticks), axis=0)
+        right = np.clip(np.searchsorted(self.times, ticks, side='right'), 1, len(self.times) - 1)
+        left = right - 1
+        t0, t1 = self.times[left], self.times[right]
+        u = np.clip((ticks - t0) / (t1 - t0), 0.0, 1.0)
+        v0, v1 = self.values[left], self.values[right]
+        if self.method == 'slerp':
+            return slerp(v0, v1, u)
+        return v0 + (v1 - v0) * u[:, None]
+
+    def first_after(self, t):
+        # Time of the first sample after t, None when there is none
+        index = np.searchsorted(self.times, t, side='right')
+        return self.times[index] if index < len(self.times) else None
+
+    def discard_older(self, t):
+        # Drops every sample before t
+        start = np.searchsorted(self.times, t, side='left')
+        self.times = self.times[start:]
+        self.values = self.values[start:]
+
+    def discard_before(self, t):
+        # Keeps the last sample at or before t, it is the left end of the next interpolation
+        start = max(0, np.searchsorted(self.times, t, side='right') - 1)
+        self.times = self.times[start:]
+        self.values = self.values[start:]
+
+
+class Resampler:
+    """
+    Aligns sensors sampled at different, jittery rates onto one clock of rate_hz ticks.
+    streams maps a name to (width, 'linear' or 'slerp'), timestamps are multiplied by time_scale to get seconds.
+    The clock only advances as far as every live stream has samples, a stream more than max_lag seconds
+    behind the newest one is held at its last value instead of stalling the others.
+    When the samples resume more than max_lag seconds after the next tick (the device paused), the clock
+    restarts at the samples after the gap instead of interpolating every tick of the gap.
+    """
+
+    def __init__(self, rate_hz=100.0, streams=None, time_scale=1e-9, max_lag=0.5):
+        if streams is None:
+            streams = {'acc': (3, 'linear'), 'gyro': (3, 'linear'), 'orientation': (4, 'slerp')}
+        self.period = 1.0 / rate_hz
+        self.time_scale = time_scale
+        self.max_lag = max_lag
+        self.streams = {name: StreamBuffer(width, method) for name, (width, method) in streams.items()}
+        self.next_tick = None
+
+    def add(self, name, timestamps, values):
+        if len(timestamps):
+            self.streams[name].add(np.asarray(timestamps, dtype=float) * self.time_scale, values)
+
+    def step(self):
+        """
+        Aligned frames for every tick that all live streams have passed.
+        Returns a dict with 'time' (n,) in seconds and an (n, width) array per stream that has samples,
+        or None when no tick is complete yet.
+        """
+        active = {name: s for name, s in self.streams.items() if len(s)}
+        if self.next_tick is not None and active:
+            resumed = [t for t in (s.first_after(self.next_tick) for s in active.values()) if t is not None]
+            if resumed and min(resumed) - self.next_tick > self.max_lag:
+                for stream in active.values():
+                    stream.discard_older(min(resumed))
+                self.next_tick = None
+                active = {name: s for name, s in active.items() if len(s)}
+        if not active:
+            return None
+        last = {name: s.last_time() for name, s in active.items()}
+        newest = max(last.values())
+        horizon = min(t for t in last.values() if t >= newest - self.max_lag)
+        if self.next_tick is None:
+            first = max(s.times[0] for s in active.values() if s.last_time() >= newest - self.max_lag)
+            self.next_tick = np.ceil(first / self.period) * self.period
+        if horizon < self.next_tick:
+            return None
+
+        count = int(np.floor((horizon - self.next_tick) / self.period)) + 1
+        ticks = self.next_tick + np.arange(count) * self.period
+        frames = {'time': ticks}
+        for name, stream in active.items():
+            frames[name] = stream.interpolate(ticks)
+            stream.discard_before(ticks[-1])
+        self.next_tick = ticks[-1] + self.period
+        return frames
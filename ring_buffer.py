@@ -0,0 +1,105 @@
+from collections import deque
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed capacity, array backed replacement for deque(maxlen=capacity).
+    Every value is written twice (at i and i + capacity) so the window is always
+    available as one contiguous view, and the window min/max are kept with
+    monotonic queues so they cost O(1) instead of a scan of the whole window.
+    """
+
+    def __init__(self, capacity, dtype=float, track_extrema=True):
+        self.capacity = capacity
+        self.data = np.zeros(2 * capacity, dtype=dtype)
+        self.pos = 0
+        self.length = 0
+        self.count = 0  # Total number of values ever appended
+        self.track_extrema = track_extrema
+        self.min_queue = deque()  # (sequence number, value), values increasing
+        self.max_queue = deque()  # (sequence number, value), values decreasing
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return self.view()[index]
+
+    def append(self, value):
+        self.data[self.pos] = value
+        self.data[self.pos + self.capacity] = value
+        self.pos = (self.pos + 1) % self.capacity
+        if self.length < self.capacity:
+            self.length += 1
+        if self.track_extrema:
+            self.__track(self.count, value)
+        self.count += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        n = len(values)
+        if n == 0:
+            return
+        start_count = self.count
+        if n > self.capacity:
+            # Only the newest values fit, older ones would be overwritten anyway
+            start_count += n - self.capacity
+            values = values[-self.capacity:]
+        index = (self.pos + np.arange(len(values))) % self.capacity
+        self.data[index] = values
+        self.data[index + self.capacity] = values
+        self.pos = (self.pos + len(values)) % self.capacity
+        self.length = min(self.capacity, self.length + len(values))
+        if self.track_extrema:
+            for seq, value in enumerate(values.tolist(), start_count):
+                self.__track(seq, value)
+        self.count += n
+
+    def __track(self, seq, value):
+        while self.min_queue and self.min_queue[-1][1] >= value:
+            self.min_queue.pop()
+        self.min_queue.append((seq, value))
+        while self.max_queue and self.max_queue[-1][1] <= value:
+            self.max_queue.pop()
+        self.max_queue.append((seq, value))
+
+        # Drop the values that fell out of the window
+        oldest = seq - self.capacity
+        while self.min_queue[0][0] <= oldest:
+            self.min_queue.popleft()
+        while self.max_queue[0][0] <= oldest:
+            self.max_queue.popleft()
+
+    def view(self):
+        # Contiguous view of the window, oldest first, no copy
+        start = (self.pos - self.length) % self.capacity
+        return self.data[start:start + self.length]
+
+    def since(self, count):
+        # View of the values appended after self.count was equal to count,
+        # None when some of them have already been overwritten
+        n = self.count - count
+        if n < 0 or n > self.length:
+            return None
+        return self.view()[self.length - n:]
+
+    def last(self):
+        return self.data[(self.pos - 1) % self.capacity]
+
+    def min(self):
+        if self.track_extrema:
+            return self.min_queue[0][1]
+        return self.view().min()
+
+    def max(self):
+        if self.track_extrema:
+            return self.max_queue[0][1]
+        return self.view().max()
+
+    def clear(self):
+        self.pos = 0
+        self.length = 0
+        self.min_queue.clear()
+        self.max_queue.clear()
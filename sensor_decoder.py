@@ -0,0 +1,209 @@
+import numpy as np
+
+import wire_protocol
+from metrics import DECODE_FAILURES
+
+# Timestamp of samples sent without one, times() turns it into NaN
+UNTIMED = np.iinfo(np.int64).min
+
+
+def times(batch):
+    # Float ns timestamps of a taken (timestamps, values) pair, NaN where the sample had no time
+    timestamps = batch[0].astype(float)
+    timestamps[batch[0] == UNTIMED] = np.nan
+    return timestamps
+
+
+class ColumnBatch:
+    """
+    Growable typed columns of one sensor stream: int64 timestamps (ns, UNTIMED when missing) and an (n, width)
+    float64 block.
+    take() hands out the filled rows and starts over in the same arrays.
+    """
+
+    def __init__(self, width, capacity=256):
+        self.width = width
+        self.times = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty((capacity, width))
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __reserve(self, n):
+        if self.count + n > len(self.times):
+            capacity = max(2 * len(self.times), self.count + n)
+            self.times = np.resize(self.times, capacity)
+            self.values = np.resize(self.values, (capacity, self.width))
+
+    def append(self, timestamp, values):
+        self.__reserve(1)
+        self.times[self.count] = UNTIMED if timestamp is None else timestamp
+        self.values[self.count] = values[:self.width]
+        self.count += 1
+
+    def extend(self, timestamps, values):
+        n = len(timestamps)
+        self.__reserve(n)
+        self.times[self.count:self.count + n] = timestamps
+        self.values[self.count:self.count + n] = values[:, :self.width]
+        self.count += n
+
+    def take(self):
+        times, values = self.times[:self.count].copy(), self.values[:self.count].copy()
+        self.count = 0
+        return times, values
+
+
+class Schema:
+    """
+    How one sensor is read from a message: the stream (batch) it goes to, its value count,
+    and extract(field, message) returning (timestamp, values), or None to skip the field.
+    """
+    __slots__ = ('stream', 'width', 'extract')
+
+    def __init__(self, stream, width, extract):
+        self.stream = stream
+        self.width = width
+        self.extract = extract
+
+
+def frame_field(field, frame):
+    # {'linearAccelerationData': [x, y, z], 'timestamp': t}, the values are the field, the time is in the frame
+    return frame.get('timestamp'), field
+
+
+def nested_value(field, frame):
+    # {'gyroscope': {'value': [x, y, z], 'timestamp': t}}, the timestamp is optional
+    value = field.get('value')
+    return (field.get('timestamp'), value) if value else None
+
+
+def untimed_value(field, frame):
+    # {'value': [x, y, z]}
+    return None, field
+
+
+def sample_values(keys):
+    # Sensor Logger samples {'name': ..., 'time': t, 'values': {'x': ..., ...}}
+    def extract(values, sample):
+        return sample['time'], [values[key] for key in keys]
+    return extract
+
+
+# TCP NDJSON frames carry any number of sensors as keys of one object
+FRAME_SCHEMAS = dict()
+# Sensor Logger payloads are lists of samples, each named after its sensor
+SAMPLE_SCHEMAS = dict()
+# wire_protocol sensor id -> (stream, width)
+RECORD_STREAMS = dict()
+
+
+def register_frame_key(key, stream, width, extract=frame_field):
+    FRAME_SCHEMAS[key] = Schema(stream, width, extract)
+
+
+def register_sample_name(name, stream, keys):
+    SAMPLE_SCHEMAS[name] = Schema(stream, len(keys), sample_values(keys))
+
+
+def register_record_sensor(sensor, stream, width):
+    RECORD_STREAMS[sensor] = (stream, width)
+
+
+register_frame_key('rotationVectorData', 'rotation_vector', 4)  # x, y, z, w (the accuracy is dropped)
+register_frame_key('linearAccelerationData', 'linear_acceleration', 3)
+register_frame_key('gyroscope', 'gyroscope', 3, nested_value)
+register_frame_key('rotationVector', 'rotvec', 3, nested_value)  # axis * angle, TCP_server_SensorStreamer
+register_frame_key('value', 'rotvec', 3, untimed_value)
+
+register_sample_name('accelerometer', 'acc', ('x', 'y', 'z'))  # Without gravity
+register_sample_name('gravity', 'gravity', ('x', 'y', 'z'))
+register_sample_name('gyroscope', 'gyro', ('x', 'y', 'z'))
+register_sample_name('orientation', 'orientation', ('qx', 'qy', 'qz', 'qw'))
+
+register_record_sensor(wire_protocol.SENSOR_ROTATION_VECTOR, 'rotation_vector', 4)
+register_record_sensor(wire_protocol.SENSOR_LINEAR_ACCELERATION, 'linear_acceleration', 3)
+register_record_sensor(wire_protocol.SENSOR_GYROSCOPE, 'gyroscope', 3)
+register_record_sensor(wire_protocol.SENSOR_ACCELEROMETER, 'accelerometer', 3)
+
+
+class SensorDecoder:
+    """
+    Single pass decoder of every message format into one ColumnBatch per stream.
+    Each frame key or sample name is routed with one lookup in the schema tables, so new sensors are
+    added with the register_* functions instead of another branch in the receive loops.
+    take() returns {stream: (timestamps, values)} of everything decoded since the last call.
+    """
+
+    def __init__(self, frame_schemas=FRAME_SCHEMAS, sample_schemas=SAMPLE_SCHEMAS, record_streams=RECORD_STREAMS):
+        self.frame_schemas = frame_schemas
+        self.sample_schemas = sample_schemas
+        self.record_streams = record_streams
+        self.batches = dict()
+        self.last_frame = None
+
+    def batch(self, stream, width):
+        batch = self.batches.get(stream)
+        if batch is None:
+            batch = self.batches[stream] = ColumnBatch(width)
+        return batch
+
+    def __write(self, schema, field, message):
+        try:
+            sample = schema.extract(field, message)
+            if sample is not None:
+                self.batch(schema.stream, schema.width).append(*sample)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            # A sensor field of the wrong shape, the other sensors of the message are still read
+            DECODE_FAILURES.inc()
+
+    def decode_frame(self, frame):
+        self.last_frame = frame
+        schemas = self.frame_schemas
+        for key, field in frame.items():
+            schema = schemas.get(key)
+            if schema is not None:
+                self.__write(schema, field, frame)
+
+    def decode_samples(self, samples):
+        schemas = self.sample_schemas
+        for sample in samples:
+            schema = schemas.get(sample.get('name'))
+            if schema is not None:
+                self.__write(schema, sample.get('values'), sample)
+
+    def decode_records(self, records):
+        # Binary records are split per sensor id with one mask each, no per record work
+        sensors = records['sensor']
+        for sensor, (stream, width) in self.record_streams.items():
+            selected = records[sensors == sensor]
+            if len(selected):
+                self.batch(stream, width).extend(selected['timestamp'], selected['values'])
+
+    def feed(self, reassembler):
+        # Everything complete in a FrameReassembler, JSON frames or binary records
+        for frame in reassembler.json_frames():
+            self.decode_frame(frame)
+        if reassembler.binary:
+            self.decode_records(reassembler.records())
+
+    def take(self):
+        return {stream: batch.take() for stream, batch in self.batches.items() if len(batch)}
+
+
+def apply_motion(batches, rot_vec, linear_acc):
+    """
+    Applies decoded batches to a RotationVector and a LinearAcceleration of TCP_server.
+    The acceleration is integrated as one block, the rotation vector only keeps the latest orientation
+    (untimed rotation samples are fine). Accelerations without a timestamp cannot be integrated and are skipped.
+    """
+    rotation = batches.get('rotation_vector')
+    if rotation is not None:
+        rot_vec.update(*rotation[1][-1].tolist())
+    acc = batches.get('linear_acceleration')
+    if acc is not None:
+        timestamps = times(acc)
+        timed = ~np.isnan(timestamps)
+        if timed.any():
+            linear_acc.update_block(timestamps[timed], acc[1][timed])
@@ -0,0 +1,281 @@
+import argparse
+import itertools
+import json
+import lzma
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+from columnar_log import make_dtype
+
+MAGIC = b'IMUARC'
+VERSION = 1
+# magic, version, header size, payload size of the json description (same layout as columnar_log)
+HEADER_STRUCT = struct.Struct('<6sHII')
+HEADER_ALIGN = 64
+# rows, compressed payload size
+CHUNK_STRUCT = struct.Struct('<II')
+# index offset, chunk count, magic
+FOOTER_MAGIC = b'IMUIDX'
+FOOTER_STRUCT = struct.Struct('<QQ6s')
+INDEX_DTYPE = np.dtype([('start', '<f8'), ('stop', '<f8'), ('offset', '<u8'), ('first_row', '<u8'), ('rows', '<u4')])
+
+COMPRESSORS = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+    'lzma': (lambda data: lzma.compress(data, preset=6), lzma.decompress),
+}
+
+# Columns, delimiter and time column of the text logs written by the recorder
+TEXT_LOGS = {
+    'orientation.txt': (('x', 'y', 'z', 'w'), ';', None),
+    'position.txt': (('x', 'y', 'z'), ';', None),
+    'phone_angles.txt': (('x', 'y', 'z'), ';', None),
+    'graphics.txt': (('x', 'y', 'z', 'timestamp'), ',', 'timestamp'),
+}
+
+
+def encode_column(values):
+    # Bit pattern deltas (lossless for floats) with the bytes shuffled so equal significance bytes are adjacent
+    bits = np.ascontiguousarray(values).view(f'<i{values.dtype.itemsize}')
+    delta = np.diff(bits, prepend=bits.dtype.type(0))
+    return delta.view(np.uint8).reshape(len(values), -1).T.tobytes()
+
+
+def decode_column(data, dtype, rows):
+    width = dtype.itemsize
+    delta = np.frombuffer(data, dtype=np.uint8).reshape(width, rows).T.copy().view(f'<i{width}').ravel()
+    return np.cumsum(delta, dtype=delta.dtype).view(dtype)
+
+
+class ArchiveWriter:
+    """
+    Session archive of fixed size chunks, every column delta encoded and the chunk compressed.
+    A sparse index of the time range of every chunk is written at the end by close(),
+    so readers can decompress only the chunks overlapping a time window.
+    Without a time column the index is on row numbers.
+    """
+
+    def __init__(self, path, columns, time_column='timestamp', chunk_rows=4096, compression='zlib'):
+        if compression not in COMPRESSORS:
+            raise ValueError(f"Unknown compression {compression}, expected one of {tuple(COMPRESSORS)}")
+        self.path = path
+        self.dtype = make_dtype(columns)
+        if time_column is not None and time_column not in self.dtype.names:
+            raise ValueError(f"Time column {time_column} is not one of {self.dtype.names}")
+        self.time_column = time_column
+        self.chunk_rows = chunk_rows
+        self.compress = COMPRESSORS[compression][0]
+        self.pending = np.empty(chunk_rows, dtype=self.dtype)
+        self.count = 0
+        self.rows = 0
+        self.index = []
+
+        self.file = open(path, 'wb')
+        description = json.dumps({
+            'columns': [[name, self.dtype.fields[name][0].str] for name in self.dtype.names],
+            'time_column': time_column, 'chunk_rows': chunk_rows, 'compression': compression,
+        }).encode('utf-8')
+        size = HEADER_STRUCT.size + len(description)
+        size += -size % HEADER_ALIGN
+        self.file.write((HEADER_STRUCT.pack(MAGIC, VERSION, size, len(description)) + description).ljust(size, b'\0'))
+
+    def write(self, rows):
+        # rows is an (n, columns) float array or a structured array of the archive dtype
+        rows = np.asarray(rows)
+        if rows.dtype != self.dtype:
+            records = np.empty(len(rows), dtype=self.dtype)
+            for i, name in enumerate(self.dtype.names):
+                records[name] = rows[:, i]
+            rows = records
+        while len(rows):
+            n = min(len(rows), self.chunk_rows - self.count)
+            self.pending[self.count:self.count + n] = rows[:n]
+            self.count += n
+            rows = rows[n:]
+            if self.count == self.chunk_rows:
+                self.__write_chunk()
+
+    def __write_chunk(self):
+        chunk = self.pending[:self.count]
+        payload = self.compress(b''.join(encode_column(chunk[name]) for name in self.dtype.names))
+        if self.time_column is None:
+            start, stop = self.rows, self.rows + self.count - 1
+        else:
+            times = chunk[self.time_column]
+            start, stop = times.min(), times.max()
+        self.index.append((start, stop, self.file.tell(), self.rows, self.count))
+        self.file.write(CHUNK_STRUCT.pack(self.count, len(payload)))
+        self.file.write(payload)
+        self.rows += self.count
+        self.count = 0
+
+    def close(self):
+        if self.count:
+            self.__write_chunk()
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=INDEX_DTYPE).tobytes())
+        self.file.write(FOOTER_STRUCT.pack(index_offset, len(self.index), FOOTER_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ArchiveReader:
+    """
+    Random access reader of a session archive.
+    Archives without an index (the writer did not close) are indexed by scanning the chunks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        magic, version, size, description_size = HEADER_STRUCT.unpack(self.file.read(HEADER_STRUCT.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a session archive")
+        if version != VERSION:
+            raise ValueError(f"Unsupported session archive version {version}")
+        description = json.loads(self.file.read(description_size).decode('utf-8'))
+        self.header_size = size
+        self.dtype = make_dtype(description['columns'])
+        self.time_column = description['time_column']
+        self.decompress = COMPRESSORS[description['compression']][1]
+        self.chunks_read = 0
+        self.index = self.__read_index()
+
+    def __read_index(self):
+        file_size = os.fstat(self.file.fileno()).st_size
+        if file_size >= self.header_size + FOOTER_STRUCT.size:
+            self.file.seek(file_size - FOOTER_STRUCT.size)
+            index_offset, count, magic = FOOTER_STRUCT.unpack(self.file.read(FOOTER_STRUCT.size))
+            if magic == FOOTER_MAGIC:
+                self.file.seek(index_offset)
+                return np.frombuffer(self.file.read(count * INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)
+        return self.__scan(file_size)
+
+    def __scan(self, file_size):
+        index = []
+        offset, first_row = self.header_size, 0
+        while offset + CHUNK_STRUCT.size <= file_size:
+            self.file.seek(offset)
+            rows, payload_size = CHUNK_STRUCT.unpack(self.file.read(CHUNK_STRUCT.size))
+            if offset + CHUNK_STRUCT.size + payload_size > file_size:
+                break  # Partially written chunk
+            if self.time_column is None:
+                start, stop = first_row, first_row + rows - 1
+            else:
+                times = self.__decode(offset)[self.time_column]
+                start, stop = times.min(), times.max()
+            index.append((start, stop, offset, first_row, rows))
+            offset += CHUNK_STRUCT.size + payload_size
+            first_row += rows
+        return np.array(index, dtype=INDEX_DTYPE)
+
+    def __len__(self):
+        return int(self.index['rows'].sum()) if len(self.index) else 0
+
+    def time_range(self):
+        if not len(self.index):
+            return None
+        return float(self.index['start'].min()), float(self.index['stop'].max())
+
+    def __decode(self, offset):
+        self.file.seek(offset)
+        rows, payload_size = CHUNK_STRUCT.unpack(self.file.read(CHUNK_STRUCT.size))
+        data = self.decompress(self.file.read(payload_size))
+        records = np.empty(rows, dtype=self.dtype)
+        position = 0
+        for name in self.dtype.names:
+            dtype = self.dtype.fields[name][0]
+            size = rows * dtype.itemsize
+            records[name] = decode_column(data[position:position + size], dtype, rows)
+            position += size
+        self.chunks_read += 1
+        return records
+
+    def read_chunk(self, i):
+        return self.__decode(int(self.index['offset'][i]))
+
+    def read(self, start=None, stop=None):
+        """
+        Rows with start <= time < stop (row numbers when the archive has no time column).
+        Only the chunks whose time range overlaps the window are decompressed.
+        """
+        lo = -np.inf if start is None else start
+        hi = np.inf if stop is None else stop
+        chunks = np.flatnonzero((self.index['stop'] >= lo) & (self.index['start'] < hi))
+        parts = []
+        for i in chunks:
+            records = self.read_chunk(i)
+            if self.time_column is None:
+                keys = self.index['first_row'][i] + np.arange(len(records))
+            else:
+                keys = records[self.time_column]
+            parts.append(records[(keys >= lo) & (keys < hi)])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=self.dtype)
+
+    def close(self):
+        self.file.close()
+
+
+def convert_text_log(src, dst=None, columns=None, delimiter=None, time_column=None, chunk_rows=4096,
+                     compression='zlib'):
+    """
+    Converts a text log to a session archive, streaming chunk_rows lines at a time.
+    The columns, delimiter and time column of the recorder's logs are known from the file name.
+    """
+    known = TEXT_LOGS.get(os.path.basename(src))
+    if columns is None:
+        if known is None:
+            raise ValueError(f"Unknown log {src}, give its columns")
+        columns, delimiter, time_column = known
+    delimiter = delimiter if delimiter is not None else ';'
+    dst = dst if dst is not None else os.path.splitext(src)[0] + '.imuarc'
+    spec = [(name, '<f8') for name in columns]
+    with open(src) as f, ArchiveWriter(dst, spec, time_column, chunk_rows, compression) as writer:
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                break
+            rows = np.loadtxt(lines, delimiter=delimiter, ndmin=2)
+            writer.write(rows)
+    return dst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session archives: convert text logs, inspect and extract windows")
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('convert', help="text logs (orientation.txt, graphics.txt, ...) to .imuarc")
+    convert.add_argument('logs', nargs='+')
+    convert.add_argument('--lzma', action='store_true', help="smaller but slower than zlib")
+    convert.add_argument('--chunk-rows', type=int, default=4096)
+    info = commands.add_parser('info')
+    info.add_argument('archive')
+    extract = commands.add_parser('extract', help="prints the rows of a time window as text")
+    extract.add_argument('archive')
+    extract.add_argument('--start', type=float)
+    extract.add_argument('--stop', type=float)
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        for log in args.logs:
+            dst = convert_text_log(log, chunk_rows=args.chunk_rows, compression='lzma' if args.lzma else 'zlib')
+            print(f"{log} ({os.path.getsize(log)} bytes) -> {dst} ({os.path.getsize(dst)} bytes)")
+    elif args.command == 'info':
+        reader = ArchiveReader(args.archive)
+        print(f"columns {reader.dtype.names}, rows {len(reader)}, chunks {len(reader.index)}, "
+              f"{reader.time_column or 'row'} range {reader.time_range()}")
+    else:
+        reader = ArchiveReader(args.archive)
+        rows = reader.read(args.start, args.stop)
+        np.savetxt(sys.stdout, np.column_stack([rows[name] for name in reader.dtype.names]), fmt='%s', delimiter=',')
+
+
+if __name__ == '__main__':
+    main()
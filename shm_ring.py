@@ -0,0 +1,162 @@
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+DEFAULT_NAME = 'imu_visualizer'
+DEFAULT_PORT = 9885  # TCP_server / ingest.py
+
+IMU_COLUMNS = ('timestamp', 'qx', 'qy', 'qz', 'qw', 'px', 'py', 'pz', 'ax', 'ay', 'az')
+
+MAGIC = 0x494D5552494E4731  # 'IMURING1'
+# Header of int64 words: magic, capacity, columns, sequence, count, writer pid, then the column names
+HEADER_WORDS = 8
+NAMES_SIZE = 256
+DATA_OFFSET = HEADER_WORDS * 8 + NAMES_SIZE
+SEQ, COUNT, PID = 3, 4, 5
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    return True
+
+
+def ring_name(port=DEFAULT_PORT):
+    # One ring per ingest port, the default port keeps the name test_plot reads by default
+    return DEFAULT_NAME if port == DEFAULT_PORT else f'{DEFAULT_NAME}_{port}'
+
+
+class SharedRingWriter:
+    """
+    Single writer ring buffer of float64 rows in shared memory.
+    Rows are written twice (at i and i + capacity) so every window is one contiguous view,
+    and the row count is published under a sequence counter (seqlock): the counter is odd
+    while the writer updates the buffer, readers retry until they see the same even value twice.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, capacity=1 << 16, columns=IMU_COLUMNS):
+        self.capacity = capacity
+        self.columns = tuple(columns)
+        size = DATA_OFFSET + 2 * capacity * len(self.columns) * 8
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            existing = shared_memory.SharedMemory(name=name)
+            header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=existing.buf)
+            magic, pid = int(header[0]), int(header[PID])
+            del header
+            if magic == MAGIC and process_alive(pid):
+                existing.close()
+                resource_tracker.unregister(existing._name, 'shared_memory')
+                raise FileExistsError(f"Shared memory {name} belongs to the running writer {pid}")
+            # Left over by a writer that did not shut down cleanly
+            existing.close()
+            existing.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=self.shm.buf)
+        names = ','.join(self.columns).encode('ascii')
+        self.shm.buf[HEADER_WORDS * 8:HEADER_WORDS * 8 + len(names)] = names
+        self.data = np.ndarray((2 * capacity, len(self.columns)), dtype=np.float64,
+                               buffer=self.shm.buf, offset=DATA_OFFSET)
+        self.header[:] = 0
+        self.header[1], self.header[2] = capacity, len(self.columns)
+        self.header[PID] = os.getpid()
+        self.header[0] = MAGIC
+        self.count = 0
+
+    def write(self, rows):
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(self.columns))
+        total = len(rows)
+        if total == 0:
+            return
+        # Only the last lap fits, the rows before it count as written (and dropped by the readers)
+        rows = rows[-self.capacity:]
+        index = (self.count + total - len(rows) + np.arange(len(rows))) % self.capacity
+        self.header[SEQ] += 1
+        self.data[index] = rows
+        self.data[index + self.capacity] = rows
+        self.count += total
+        self.header[COUNT] = self.count
+        self.header[SEQ] += 1
+
+    def close(self):
+        self.header[0] = 0
+        self.header = self.data = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedRingReader:
+    """
+    Attaches to a SharedRingWriter and returns the rows appended since the previous read.
+    """
+
+    def __init__(self, name=DEFAULT_NAME):
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=self.shm.buf)
+        # Readers must not unlink the segment when they exit, only the writer owns it. A writer in this
+        # process registered the same name, its unlink needs that registration
+        if self.header[PID] != os.getpid():
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        if self.header[0] != MAGIC:
+            raise ValueError(f"Shared memory {name} is not an IMU ring buffer")
+        self.capacity = int(self.header[1])
+        names = bytes(self.shm.buf[HEADER_WORDS * 8:DATA_OFFSET]).rstrip(b'\0').decode('ascii')
+        self.columns = tuple(names.split(','))
+        self.data = np.ndarray((2 * self.capacity, len(self.columns)), dtype=np.float64,
+                               buffer=self.shm.buf, offset=DATA_OFFSET)
+        self.position = None  # Total rows read so far, starts at the writer's current count
+        self.view_start = 0
+        self.dropped = 0
+
+    def writer_count(self):
+        while True:
+            seq = self.header[SEQ]
+            if seq % 2:
+                time.sleep(0)
+                continue
+            count = int(self.header[COUNT])
+            if self.header[SEQ] == seq:
+                return count
+
+    def read_new(self, copy=False):
+        """
+        Rows appended since the last call, as an (n, columns) array.
+        Without copy the rows are a zero-copy view of the shared buffer, still_valid() tells
+        if the writer has overwritten them since.
+        """
+        count = self.writer_count()
+        if self.position is None or count < self.position:
+            # First read, or the writer restarted
+            self.position = count
+        start = max(self.position, count - self.capacity)
+        self.dropped += start - self.position
+        self.position = count
+        offset = start % self.capacity
+        rows = self.data[offset:offset + count - start]
+        self.view_start = start
+        if copy:
+            rows = rows.copy()
+            if not self.still_valid():
+                # The writer lapped us while copying, only the rows that are still intact are kept
+                lost = min(len(rows), self.writer_count() - self.capacity - start)
+                self.dropped += lost
+                rows = rows[lost:]
+        return rows
+
+    def still_valid(self):
+        # The last returned rows are intact while the writer is less than a lap ahead of their start
+        return self.writer_count() - self.capacity <= self.view_start
+
+    def column(self, rows, name):
+        return rows[:, self.columns.index(name)]
+
+    def close(self):
+        self.header = self.data = None
+        self.shm.close()
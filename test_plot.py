@@ -1,34 +1,52 @@
 import matplotlib
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
 from matplotlib import style
+import os
+
+import numpy as np
+
+from columnar_log import ColumnarTailReader
+from live_plot import LivePlot
+from recorder import OUTPUT_DIR
+from shm_ring import SharedRingReader, ring_name
 
 matplotlib.use('TkAgg')  # Set the backend to TkAgg
 
 style.use('fivethirtyeight')
 
 fig = plt.figure()
-ax1 = fig.add_subplot(1, 1, 1)
-
-
-def animate(i):
-    graph_data = open(r"C:\Users\Admin\Desktop\graphics.txt", 'r').read()
-    lines = graph_data.split('\n')
-
-    acc = []
-    time = []
-
-    for line in lines:
-        if len(line) > 1:
-            x, y, z, t = line.split(',')
-            acc.append([float(x), float(y), float(z)])
-            time.append(float(t))
-
-    ax1.clear()
-    ax1.set_xlim(time[-1] - 7, time[-1] + 7)
-    ax1.set_ylim(-2, 2)
-    plt.plot(time, acc)
-
 
-ani = animation.FuncAnimation(fig, animate, interval=10)
+WINDOW_ROWS = 5000  # Rows kept for plotting, more than the 14 s visible at 200 Hz
+LOD_POINTS = 2000  # Points per trace after min/max decimation
+TARGET_FPS = 60
+ORIENTATION_VIEW = True  # 3D view of the phone axes, needs the quaternions of the shared memory ring
+
+LIVE_SOURCE = 'shm'  # 'shm': shared memory ring of a running TCP_server, 'file': tail graphics.bin
+LIVE_PORT = 9885  # Port of the TCP_server or ingest.py --live process, every port has its own ring
+
+if LIVE_SOURCE == 'shm':
+    try:
+        reader = SharedRingReader(ring_name(LIVE_PORT))
+    except FileNotFoundError:
+        print("No running TCP_server, plotting graphics.bin")
+        LIVE_SOURCE = 'file'
+if LIVE_SOURCE == 'file':
+    reader = ColumnarTailReader(os.path.join(OUTPUT_DIR, 'graphics.bin'))
+
+
+def read_new():
+    # New (n, 4) rows of timestamp, x, y, z, the total number of rows read so far and the latest quaternion
+    if LIVE_SOURCE == 'shm':
+        rows = reader.read_new()
+        new = rows[:, [reader.columns.index(name) for name in ('timestamp', 'ax', 'ay', 'az')]]
+        quaternion = rows[-1, [reader.columns.index(name) for name in ('qx', 'qy', 'qz', 'qw')]] if len(rows) else None
+        return new, reader.position, quaternion
+    rows = reader.read_new()
+    if rows is None:
+        return None, reader.offset, None
+    return np.column_stack((rows['timestamp'], rows['x'], rows['y'], rows['z'])), reader.offset, None
+
+
+plot = LivePlot(fig, read_new, WINDOW_ROWS, LOD_POINTS, orientation=ORIENTATION_VIEW)
+timer = plot.run(TARGET_FPS)
 plt.show()
@@ -0,0 +1,46 @@
+import numpy as np
+
+# A binary stream starts with this marker, anything else is read as newline delimited JSON
+STREAM_MAGIC = b'IMUBIN1\n'
+
+# Fixed little-endian records, 28 bytes: sensor id, reserved, timestamp (ns), four values
+RECORD_DTYPE = np.dtype([
+    ('sensor', '<u2'),
+    ('reserved', '<u2'),
+    ('timestamp', '<i8'),
+    ('values', '<f4', (4,)),
+])
+RECORD_SIZE = RECORD_DTYPE.itemsize
+
+SENSOR_ROTATION_VECTOR = 1  # x, y, z, w
+SENSOR_LINEAR_ACCELERATION = 2  # x, y, z
+SENSOR_GYROSCOPE = 3  # x, y, z
+SENSOR_ACCELEROMETER = 4  # x, y, z
+
+
+def encode_records(sensor, timestamps, values):
+    """
+    Packs samples of one sensor (timestamps (n,) in ns, values (n, <=4)) into wire records.
+    """
+    values = np.asarray(values, dtype=np.float32)
+    values = values.reshape(len(values), -1)
+    records = np.zeros(len(values), dtype=RECORD_DTYPE)
+    records['sensor'] = sensor
+    records['timestamp'] = timestamps
+    records['values'][:, :values.shape[1]] = values
+    return records.tobytes()
+
+
+def decode_records(buffer):
+    """
+    Decodes the complete records at the start of buffer with one np.frombuffer call.
+    Returns (records, consumed bytes), the records are a read-only view over a single copy of those bytes.
+    """
+    count = len(buffer) // RECORD_SIZE
+    consumed = count * RECORD_SIZE
+    # Slicing the memoryview copies nothing, bytes() is the one copy. The view is released before the
+    # caller resizes the bytearray
+    with memoryview(buffer) as view:
+        data = bytes(view[:consumed])
+    return np.frombuffer(data, dtype=RECORD_DTYPE, count=count), consumed
+
@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+
+import metrics
+from recorder import get_recorder
+from ws_server import WebSocketConnection, accept_key
+
+DEFAULT_SENSORS = ('android.sensor.orientation', 'android.sensor.gyroscope', 'android.sensor.accelerometer')
+# Value columns of every sensor, unknown sensors get x, y, z
+SENSOR_VALUES = {
+    'android.sensor.rotation_vector': ('x', 'y', 'z', 'w', 'accuracy'),
+    'android.sensor.game_rotation_vector': ('x', 'y', 'z', 'w'),
+}
+
+SAMPLES = metrics.counter('imu_ws_samples_total', "Samples received from phone websocket streams")
+RECONNECTS = metrics.counter('imu_ws_reconnects_total', "Websocket stream reconnect attempts")
+
+
+async def connect(host, port, path, timeout=10.0):
+    """
+    Opens a client websocket connection with the stdlib, returns a WebSocketConnection.
+    """
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    writer.write((
+        f'GET {path} HTTP/1.1\r\n'
+        f'Host: {host}:{port}\r\n'
+        'Upgrade: websocket\r\n'
+        'Connection: Upgrade\r\n'
+        f'Sec-WebSocket-Key: {key}\r\n'
+        'Sec-WebSocket-Version: 13\r\n\r\n'
+    ).encode('ascii'))
+    try:
+        response = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        writer.close()
+        raise ConnectionError(f"{host}:{port} closed the connection during the handshake")
+    lines = response.decode('latin-1').split('\r\n')
+    headers = {k.lower(): v for k, v in (line.split(': ', 1) for line in lines[1:] if ': ' in line)}
+    if lines[0].split(' ')[1:2] != ['101'] or headers.get('sec-websocket-accept') != accept_key(key):
+        writer.close()
+        raise ConnectionError(f"{host}:{port} refused the websocket upgrade: {lines[0]}")
+    return WebSocketConnection(reader, writer, path, client=True)
+
+
+class SensorStream:
+    """
+    One sensor of one phone, its samples go to a columnar recording <sensor>_<host>_<port>.bin.
+    """
+
+    def __init__(self, host, port, sensor, recorder):
+        self.host = host
+        self.port = port
+        self.sensor = sensor
+        self.path = f'/sensor/connect?type={sensor}'
+        self.values = SENSOR_VALUES.get(sensor, ('x', 'y', 'z'))
+        columns = [('timestamp', '<f8')] + [(name, '<f8') for name in self.values]
+        name = f"{sensor.rsplit('.', 1)[-1]}_{host.replace('.', '-')}_{port}.bin"
+        self.channel = recorder.columnar_channel(name, columns)
+        self.samples = 0
+        self.reconnects = 0
+        self.connected = False
+
+    def row(self, sample):
+        # Timestamp in seconds followed by the values, missing values are NaN
+        values = list(sample['values'][:len(self.values)])
+        values += [math.nan] * (len(self.values) - len(values))
+        return [sample['timestamp'] / 1e9] + values
+
+    def __repr__(self):
+        return f"{self.sensor}@{self.host}:{self.port}"
+
+
+class MultiSensorClient:
+    """
+    Subscribes to many sensors of many phones concurrently on one asyncio event loop.
+    Every stream reconnects with exponential backoff and writes through the batched recorder,
+    on_sample(stream, sample) is called for every decoded sample.
+    """
+
+    def __init__(self, phones, sensors=DEFAULT_SENSORS, recorder=None, backoff=(0.5, 30.0), on_sample=None):
+        self.recorder = recorder if recorder is not None else get_recorder()
+        self.backoff = backoff
+        self.on_sample = on_sample
+        self.streams = []
+        for phone in phones:
+            host, _, port = phone.partition(':')
+            for sensor in sensors:
+                self.streams.append(SensorStream(host, int(port or 8080), sensor, self.recorder))
+        self.stopped = False
+
+    async def run(self, duration=None):
+        tasks = [asyncio.ensure_future(self.__stream(stream)) for stream in self.streams]
+        try:
+            await asyncio.wait(tasks, timeout=duration)
+        finally:
+            self.stopped = True
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.recorder.flush()
+
+    async def __stream(self, stream):
+        delay = self.backoff[0]
+        while not self.stopped:
+            try:
+                connection = await connect(stream.host, stream.port, stream.path)
+            except (OSError, asyncio.TimeoutError) as e:
+                print(f"{stream}: {e}")
+            else:
+                print(f"{stream}: connected")
+                stream.connected = True
+                delay = self.backoff[0]
+                try:
+                    await self.__receive(stream, connection)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    pass
+                finally:
+                    stream.connected = False
+                    await connection.close()
+                print(f"{stream}: connection closed")
+            if self.stopped:
+                break
+            stream.reconnects += 1
+            RECONNECTS.inc()
+            # Jitter keeps the streams of a phone that went away from reconnecting in lockstep
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, self.backoff[1])
+
+    async def __receive(self, stream, connection):
+        while True:
+            message = await connection.receive()
+            if message is None:
+                return
+            try:
+                sample = json.loads(message)
+                row = stream.row(sample)
+            except (ValueError, KeyError, TypeError):
+                metrics.DECODE_FAILURES.inc()
+                continue
+            stream.channel.append(row)
+            stream.samples += 1
+            SAMPLES.inc()
+            if self.on_sample is not None:
+                self.on_sample(stream, sample)
+
+    def get_stats(self):
+        return {repr(s): {'samples': s.samples, 'reconnects': s.reconnects, 'connected': s.connected}
+                for s in self.streams}
+
+
+async def run_with_standin(client, port, rate, duration):
+    # Serves synthetic sensor streams on 127.0.0.1:port for the client, see load_generator
+    from load_generator import LoadGenerator
+    from ws_server import WebSocketServer
+    generator = LoadGenerator(argparse.Namespace(rate=rate, speed=1, replay=None))
+    server = WebSocketServer(generator.ws_client, '127.0.0.1', port)
+    await server.start()
+    try:
+        await client.run(duration)
+    finally:
+        generator.stopped = True
+        server.close()
+        # Let the stand-in handlers see the stop flag before the loop shuts down
+        await asyncio.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Records sensor streams of phones running a websocket sensor server")
+    parser.add_argument('phones', nargs='*', default=['192.168.0.140:8080'], help="host:port of every phone")
+    parser.add_argument('--sensors', nargs='+', default=DEFAULT_SENSORS)
+    parser.add_argument('--duration', type=float, help="seconds, runs until interrupted by default")
+    parser.add_argument('--local', action='store_true',
+                        help="stream from a local synthetic stand-in on 127.0.0.1:8080 instead of a phone")
+    parser.add_argument('--rate', type=float, default=100, help="samples per second of the stand-in")
+    args = parser.parse_args()
+
+    phones = ['127.0.0.1:8080'] if args.local else args.phones
+    client = MultiSensorClient(phones, args.sensors)
+    metrics.StatsReporter().start()
+    try:
+        if args.local:
+            asyncio.run(run_with_standin(client, 8080, args.rate, args.duration))
+        else:
+            asyncio.run(client.run(args.duration))
+    except KeyboardInterrupt:
+        pass
+    print(client.get_stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC11B85'
+
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1(key.encode('ascii') + WS_GUID).digest()).decode('ascii')
+
+
+def encode_frame(payload, opcode=OP_TEXT, mask=False):
+    # Server to client frames are not masked, client to server frames must be
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    n = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if n < 126:
+        header = struct.pack('!BB', 0x80 | opcode, mask_bit | n)
+    elif n < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, mask_bit | 126, n)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, mask_bit | 127, n)
+    if mask:
+        key = os.urandom(4)
+        return header + key + bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    return header + payload
+
+
+async def read_frame(reader):
+    # Returns (opcode, payload), client to server frames are masked
+    b0, b1 = await reader.readexactly(2)
+    n = b1 & 0x7F
+    if n == 126:
+        n, = struct.unpack('!H', await reader.readexactly(2))
+    elif n == 127:
+        n, = struct.unpack('!Q', await reader.readexactly(8))
+    mask = await reader.readexactly(4) if b1 & 0x80 else None
+    payload = await reader.readexactly(n)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return b0 & 0x0F, payload
+
+
+class WebSocketConnection:
+    def __init__(self, reader, writer, path, client=False):
+        self.reader = reader
+        self.writer = writer
+        self.path = path
+        self.client = client  # The client side masks what it sends
+        self.closed = False
+
+    async def send(self, message):
+        self.writer.write(encode_frame(message, mask=self.client))
+        await self.writer.drain()
+
+    async def receive(self):
+        # Answers pings and returns None once the client closed the connection
+        while True:
+            opcode, payload = await read_frame(self.reader)
+            if opcode == OP_PING:
+                self.writer.write(encode_frame(payload, OP_PONG, self.client))
+            elif opcode == OP_CLOSE:
+                self.closed = True
+                self.writer.write(encode_frame(payload[:2], OP_CLOSE, self.client))
+                return None
+            else:
+                return payload
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.writer.write(encode_frame(b'', OP_CLOSE, self.client))
+                await self.writer.drain()
+            except ConnectionError:
+                pass
+        self.writer.close()
+
+
+class WebSocketServer:
+    """
+    Minimal stdlib websocket server, enough to stand in for the phone's sensor server.
+    handler is a coroutine called with a WebSocketConnection for every client.
+    """
+
+    def __init__(self, handler, host='127.0.0.1', port=8080):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.__accept, self.host, self.port)
+        return self.server
+
+    async def __accept(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+        lines = request.decode('latin-1').split('\r\n')
+        path = lines[0].split(' ')[1] if len(lines[0].split(' ')) > 1 else '/'
+        headers = dict(line.split(': ', 1) for line in lines[1:] if ': ' in line)
+        key = {k.lower(): v for k, v in headers.items()}.get('sec-websocket-key')
+        if key is None:
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            writer.close()
+            return
+        writer.write((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n'
+        ).encode('ascii'))
+        await writer.drain()
+        connection = WebSocketConnection(reader, writer, path)
+        try:
+            await self.handler(connection)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            await connection.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()